@@ -0,0 +1,237 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from recipes.models import Cart, Favorite, IngredientToRecipe, Recipe, Tag
+from recipes.search import ingredient_index
+from users.models import Follow
+from .cache import acatalogue_state, catalogue_validators, set_validators
+from .paginators import LimitPagePagination
+from .serializers import RecipeSerializer, TagSerializer
+from .views import (
+    IngredientsViewSet,
+    RecipeViewSet,
+    TagsViewSet,
+    ingredient_search_limit,
+    recipe_queryset,
+)
+
+
+async def authenticate(request):
+    """Пользователь по токену или None, если токен неверный"""
+    header = request.headers.get('Authorization', '').split()
+    if not header or header[0].lower() != 'token':
+        return AnonymousUser()
+    if len(header) != 2:
+        return None
+    token = await Token.objects.select_related('user').filter(
+        key=header[1]
+    ).afirst()
+    if token is None or not token.user.is_active:
+        return None
+    return token.user
+
+
+def render(data):
+    return HttpResponse(
+        JSONRenderer().render(data), content_type='application/json'
+    )
+
+
+def async_read(sync_view):
+    """GET обслуживается асинхронно, остальные запросы и ошибки —
+    синхронным представлением DRF"""
+    fallback = sync_to_async(sync_view)
+
+    def decorator(handler):
+        async def view(request, *args, **kwargs):
+            if request.method == 'GET':
+                user = await authenticate(request)
+                if user is not None:
+                    request.user = user
+                    response = await handler(request, *args, **kwargs)
+                    if response is not None:
+                        return response
+            return await fallback(request, *args, **kwargs)
+        view.csrf_exempt = True
+        return view
+    return decorator
+
+
+async def fetch_all(queryset):
+    return [obj async for obj in queryset]
+
+
+def set_prefetched(instance, name, objects):
+    """Кладёт загруженные объекты туда же, куда prefetch_related"""
+    queryset = getattr(instance, name).all()
+    queryset._result_cache = objects
+    queryset._prefetch_done = True
+    instance.__dict__.setdefault('_prefetched_objects_cache', {})[
+        name
+    ] = queryset
+
+
+async def load_viewer_flags(recipe, user):
+    if user.is_anonymous:
+        return
+    (
+        recipe.is_favorited,
+        recipe.is_in_shopping_cart,
+        recipe.author.is_subscribed,
+    ) = await asyncio.gather(
+        Favorite.objects.filter(user=user, recipe=recipe).aexists(),
+        Cart.objects.filter(user=user, recipe=recipe).aexists(),
+        Follow.objects.filter(user=user, author=recipe.author_id).aexists(),
+    )
+
+
+async def load_related(recipe):
+    tags, ingredients = await asyncio.gather(
+        fetch_all(recipe.tags.all()),
+        fetch_all(IngredientToRecipe.objects.filter(
+            recipe=recipe
+        ).select_related('ingredient')),
+    )
+    set_prefetched(recipe, 'tags', tags)
+    set_prefetched(recipe, 'ingredient_recipe', ingredients)
+
+
+async def load_related_many(recipes):
+    """Тэги и ингредиенты страницы рецептов двумя запросами"""
+    ids = [recipe.id for recipe in recipes]
+    tags, ingredients = await asyncio.gather(
+        fetch_all(Recipe.tags.through.objects.filter(
+            recipe_id__in=ids
+        ).select_related('tag').order_by('-tag_id')),
+        fetch_all(IngredientToRecipe.objects.filter(
+            recipe_id__in=ids
+        ).select_related('ingredient')),
+    )
+    recipe_tags = {pk: [] for pk in ids}
+    for link in tags:
+        recipe_tags[link.recipe_id].append(link.tag)
+    recipe_ingredients = {pk: [] for pk in ids}
+    for link in ingredients:
+        recipe_ingredients[link.recipe_id].append(link)
+    for recipe in recipes:
+        set_prefetched(recipe, 'tags', recipe_tags[recipe.id])
+        set_prefetched(
+            recipe, 'ingredient_recipe', recipe_ingredients[recipe.id]
+        )
+
+
+def positive_param(request, name, default):
+    """Положительное число из запроса или None"""
+    value = request.GET.get(name)
+    if value is None:
+        return default
+    if not value.isdigit() or int(value) < 1:
+        return None
+    return int(value)
+
+
+def page_links(request, page, size, count):
+    url = request.build_absolute_uri()
+    next_link = None
+    if page * size < count:
+        next_link = replace_query_param(url, 'page', page + 1)
+    previous = None
+    if page == 2:
+        previous = remove_query_param(url, 'page')
+    elif page > 2:
+        previous = replace_query_param(url, 'page', page - 1)
+    return next_link, previous
+
+
+@async_read(RecipeViewSet.as_view({'get': 'list', 'post': 'create'}))
+async def recipe_list(request):
+    """Страница рецептов без фильтров: COUNT и страница, затем тэги и
+    ингредиенты загружаются одновременно
+
+    Фильтры, поиск, сортировки и курсор обслуживает sync-вид.
+    """
+    if set(request.GET) - {'page', 'limit'}:
+        return None
+    page = positive_param(request, 'page', 1)
+    size = positive_param(request, 'limit', LimitPagePagination.page_size)
+    if page is None or size is None:
+        return None
+    start = (page - 1) * size
+    count, recipes = await asyncio.gather(
+        Recipe.objects.acount(),
+        fetch_all(recipe_queryset(request.user)[start:start + size]),
+    )
+    if not recipes and page > 1:
+        return None
+    await load_related_many(recipes)
+    next_link, previous = page_links(request, page, size, count)
+    return render({
+        'count': count,
+        'next': next_link,
+        'previous': previous,
+        'results': RecipeSerializer(
+            recipes, many=True, context={'request': request}
+        ).data,
+    })
+
+
+@async_read(TagsViewSet.as_view({'get': 'list'}))
+async def tag_list(request):
+    """Тэги с теми же ETag и кэшем, что у sync-вида"""
+    etag, last_modified, key = catalogue_validators(
+        request, *await acatalogue_state(Tag)
+    )
+    not_modified = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if not_modified is not None:
+        return not_modified
+    data = cache.get(key)
+    if data is None:
+        data = TagSerializer(
+            await fetch_all(TagsViewSet.queryset.all()), many=True
+        ).data
+        cache.set(key, data, settings.CATALOGUE_CACHE_TIMEOUT)
+    return set_validators(render(data), etag, last_modified)
+
+
+@async_read(RecipeViewSet.as_view({
+    'get': 'retrieve',
+    'put': 'update',
+    'patch': 'partial_update',
+    'delete': 'destroy',
+}))
+async def recipe_detail(request, pk):
+    """Рецепт: флаги пользователя и связи загружаются одновременно"""
+    recipe = await Recipe.objects.select_related('author').filter(
+        pk=pk
+    ).afirst()
+    if recipe is None:
+        return None
+    await asyncio.gather(
+        load_viewer_flags(recipe, request.user), load_related(recipe)
+    )
+    return render(
+        RecipeSerializer(recipe, context={'request': request}).data
+    )
+
+
+@async_read(IngredientsViewSet.as_view({'get': 'list'}))
+async def ingredient_list(request):
+    """Поиск ингредиентов, список без name отдаёт кэширующий sync-вид"""
+    name = request.GET.get('name')
+    limit = ingredient_search_limit(request.GET)
+    if not name or limit is None:
+        return None
+    return render(
+        await sync_to_async(ingredient_index.search)(name, limit)
+    )
@@ -0,0 +1,140 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from recipes.models import Ingredient, Tag
+
+
+def get_versions(names):
+    """Версии объектов: время последнего изменения в миллисекундах"""
+    keys = {name: f'version:{name}' for name in names}
+    versions = cache.get_many(keys.values())
+    missing = [key for key in keys.values() if key not in versions]
+    if missing:
+        now = int(time.time() * 1000)
+        for key in missing:
+            cache.add(key, now, None)
+        versions.update(cache.get_many(missing))
+    return {name: versions[key] for name, key in keys.items()}
+
+
+def bump_version(name):
+    """Новая версия делает старые записи кэша недоступными"""
+    key = f'version:{name}'
+    version = max(int(time.time() * 1000), (cache.get(key) or 0) + 1)
+    cache.set(key, version, None)
+
+
+def catalogue_name(model):
+    return f'catalogue:{model._meta.label_lower}'
+
+
+def get_catalogue_version(model):
+    """Версия справочника"""
+    name = catalogue_name(model)
+    return get_versions([name])[name]
+
+
+def bump_catalogue_version(model):
+    bump_version(catalogue_name(model))
+
+
+def catalogue_state(model):
+    """Число записей справочника и время его последнего изменения в мс
+
+    Считается по базе, поэтому одинаково во всех процессах: правка в
+    другом воркере или загрузка load_ingredients сразу меняют ETag.
+    """
+    return state_values(model.objects.aggregate(**catalogue_aggregates()))
+
+
+async def acatalogue_state(model):
+    """То же для асинхронных представлений"""
+    return state_values(
+        await model.objects.aaggregate(**catalogue_aggregates())
+    )
+
+
+def catalogue_aggregates():
+    return {'count': Count('id'), 'updated': Max('updated')}
+
+
+def state_values(state):
+    updated = state['updated']
+    return state['count'], int(updated.timestamp() * 1000) if updated else 0
+
+
+def catalogue_validators(request, count, modified):
+    """ETag, Last-Modified в секундах и ключ кэша ответа"""
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return (
+        f'"{count}-{modified}-{path}"',
+        modified // 1000,
+        f'catalogue:{count}:{modified}:{path}',
+    )
+
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def recipe_fragment_keys(recipes, host):
+    """Ключи кэша представлений рецептов с учётом всех их версий"""
+    catalogues = [catalogue_name(Tag), catalogue_name(Ingredient)]
+    versions = get_versions(catalogues + [
+        name for recipe in recipes for name in (
+            f'recipe:{recipe.id}', f'user:{recipe.author_id}'
+        )
+    ])
+    catalogues_version = ':'.join(
+        str(versions[name]) for name in catalogues
+    )
+    return {
+        recipe.id: (
+            f'recipe:{recipe.id}:{host}:{versions[f"recipe:{recipe.id}"]}:'
+            f'{versions[f"user:{recipe.author_id}"]}:{catalogues_version}'
+        )
+        for recipe in recipes
+    }
+
+
+class CatalogueCacheMixin:
+    """Кэширование ответов справочников с ETag и Last-Modified
+
+    Ответ хранится под ключом с состоянием справочника из базы, поэтому
+    кэш в памяти процесса не отдаёт устаревших данных.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def cached_response(self, view, request, *args, **kwargs):
+        etag, last_modified, key = catalogue_validators(
+            request, *catalogue_state(self.queryset.model)
+        )
+        not_modified = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if not_modified is not None:
+            return not_modified
+        data = cache.get(key)
+        if data is None:
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            data = response.data
+            cache.set(key, data, settings.CATALOGUE_CACHE_TIMEOUT)
+        return set_validators(Response(data), etag, last_modified)
@@ -1,33 +1,79 @@
+from django import forms
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import Case, Exists, F, IntegerField, OuterRef, When
 from django_filters.rest_framework import FilterSet, filters
-from recipes.models import Ingredient, Recipe, Tag
+from recipes.models import Recipe, Tag
+from recipes.search import recipe_search_index
 
 User = get_user_model()
 
 
-class IngredientFilter(FilterSet):
-    name = filters.CharFilter(lookup_expr='startswith')
+# сортировки по оценкам из refresh_recipe_scores, id — для курсора
+RECIPE_ORDERINGS = {
+    'popular': ('-popularity', '-id'),
+    'trending': ('-trending', '-id'),
+}
 
-    class Meta:
-        model = Ingredient
-        fields = ['name']
+
+class TagsField(forms.MultipleChoiceField):
+    """Слаги тэгов, проверяемые по базе и заменяемые на их id
+
+    Справочник не кэшируется: тэг, добавленный в другом воркере или
+    загрузкой load_ingredients, сразу доступен в фильтре.
+    """
+
+    def valid_value(self, value):
+        return True
+
+    def clean(self, value):
+        slugs = super().clean(value)
+        if not slugs:
+            return []
+        tag_ids = dict(
+            Tag.objects.filter(slug__in=slugs).values_list('slug', 'id')
+        )
+        for slug in slugs:
+            if slug not in tag_ids:
+                raise forms.ValidationError(
+                    self.error_messages['invalid_choice'],
+                    code='invalid_choice',
+                    params={'value': slug},
+                )
+        return list(set(tag_ids.values()))
+
+
+class TagsFilter(filters.Filter):
+    field_class = TagsField
+
+
+class OrderingChoiceFilter(filters.Filter):
+    field_class = forms.ChoiceField
 
 
 class RecipeFilter(FilterSet):
-    tags = filters.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all(),
-    )
+    tags = TagsFilter(method='filter_tags')
 
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart')
+    search = filters.CharFilter(method='filter_search')
+    ordering = OrderingChoiceFilter(
+        method='filter_ordering',
+        choices=[(name, name) for name in RECIPE_ORDERINGS],
+    )
 
     class Meta:
         model = Recipe
         fields = ('tags', 'author',)
 
+    def filter_tags(self, queryset, name, value):
+        """Рецепты хотя бы с одним из тэгов, без JOIN и DISTINCT"""
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            tag_id__in=value, recipe_id=OuterRef('pk'),
+        )))
+
     def filter_is_favorited(self, queryset, name, value):
         user = self.request.user
         if value and not user.is_anonymous:
@@ -39,3 +85,24 @@ class RecipeFilter(FilterSet):
         if value and not user.is_anonymous:
             return queryset.filter(cart__user=user)
         return queryset
+
+    def filter_search(self, queryset, name, value):
+        """Полнотекстовый поиск по названию, описанию и ингредиентам"""
+        if not value.strip():
+            return queryset
+        if connection.vendor == 'postgresql':
+            query = SearchQuery(
+                value, config='russian', search_type='websearch'
+            )
+            return queryset.filter(search_document=query).annotate(
+                rank=SearchRank(F('search_document'), query)
+            ).order_by('-rank', '-pub_date', '-id')
+        ids = recipe_search_index.search(value)
+        return queryset.filter(id__in=ids).order_by(Case(
+            *(When(id=pk, then=position) for position, pk in enumerate(ids)),
+            output_field=IntegerField()
+        ))
+
+    def filter_ordering(self, queryset, name, value):
+        """Популярные или набирающие популярность рецепты по индексу"""
+        return queryset.order_by(*RECIPE_ORDERINGS[value])
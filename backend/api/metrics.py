@@ -0,0 +1,235 @@
+import logging
+import secrets
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+
+logger = logging.getLogger(__name__)
+
+current = ContextVar('request_metrics', default=None)
+
+
+class Histogram:
+    """Гистограмма в формате Prometheus, своя на каждый процесс"""
+
+    def __init__(self, name, description, buckets):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.series = defaultdict(lambda: [0] * (len(buckets) + 2))
+        self.lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series[labels]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        yield f'# HELP {self.name} {self.description}'
+        yield f'# TYPE {self.name} histogram'
+        with self.lock:
+            series = {labels: list(values)
+                      for labels, values in self.series.items()}
+        for labels, values in sorted(series.items()):
+            total = 0
+            bounds = [*map(str, self.buckets), '+Inf']
+            for bound, count in zip(bounds, values):
+                total += count
+                yield (f'{self.name}_bucket'
+                       f'{format_labels(labels, le=bound)} {total}')
+            yield f'{self.name}_sum{format_labels(labels)} {values[-1]:g}'
+            yield f'{self.name}_count{format_labels(labels)} {total}'
+
+
+class Total:
+    """Счётчик в формате Prometheus"""
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self.series = Counter()
+        self.lock = threading.Lock()
+
+    def increment(self, labels):
+        with self.lock:
+            self.series[labels] += 1
+
+    def render(self):
+        yield f'# HELP {self.name} {self.description}'
+        yield f'# TYPE {self.name} counter'
+        with self.lock:
+            series = dict(self.series)
+        for labels, value in sorted(series.items()):
+            yield f'{self.name}{format_labels(labels)} {value}'
+
+
+def format_labels(labels, **extra):
+    pairs = [*labels, *extra.items()]
+    return '{' + ','.join(
+        '{}="{}"'.format(name, str(value).replace('"', '\\"'))
+        for name, value in pairs
+    ) + '}'
+
+
+SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+REQUEST_SECONDS = Histogram(
+    'foodgram_request_duration_seconds', 'Время ответа', SECONDS
+)
+RESPONSE_BYTES = Histogram(
+    'foodgram_response_size_bytes', 'Размер ответа',
+    (256, 1024, 4096, 16384, 65536, 262144, 1048576),
+)
+SQL_QUERIES = Histogram(
+    'foodgram_sql_queries', 'Запросов к базе за ответ',
+    (1, 2, 3, 5, 10, 20, 50, 100),
+)
+SQL_SECONDS = Histogram(
+    'foodgram_sql_duration_seconds', 'Время запросов к базе', SECONDS
+)
+SERIALIZER_SECONDS = Histogram(
+    'foodgram_serializer_duration_seconds', 'Время сериализации', SECONDS
+)
+N_PLUS_ONE = Total(
+    'foodgram_n_plus_one_total', 'Ответы с повторяющимся запросом'
+)
+
+REGISTRY = (
+    REQUEST_SECONDS, RESPONSE_BYTES, SQL_QUERIES, SQL_SECONDS,
+    SERIALIZER_SECONDS, N_PLUS_ONE,
+)
+
+
+class RequestMetrics:
+    """Замеры одного запроса, попавшего в выборку"""
+
+    def __init__(self):
+        self.queries = 0
+        self.timings = defaultdict(float)
+        self.statements = Counter()
+        self.depth = 0
+
+    def add_query(self, sql, duration):
+        self.queries += 1
+        self.timings['db'] += duration
+        self.statements[sql] += 1
+
+    def repeated(self):
+        """Одинаковые запросы, повторённые не меньше порога, — кандидаты
+        в N+1"""
+        return {
+            sql: count for sql, count in self.statements.items()
+            if count >= settings.METRICS_N_PLUS_ONE_THRESHOLD
+        }
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.add_query(sql, time.perf_counter() - started)
+
+
+@receiver(connection_created, dispatch_uid='request_metrics')
+def install_query_recorder(sender, connection, **kwargs):
+    """Обёртка ставится один раз на соединение и без выборки ничего не
+    делает"""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def timed(name):
+    """Время блока; вложенные блоки не считаются второй раз"""
+    metrics = current.get()
+    if metrics is None or metrics.depth:
+        yield
+        return
+    metrics.depth += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.depth -= 1
+        metrics.timings[name] += time.perf_counter() - started
+
+
+class TimedSerializerMixin:
+    """Учитывает время to_representation в метрике serializer"""
+
+    def to_representation(self, instance):
+        with timed('serializer'):
+            return super().to_representation(instance)
+
+
+def route_of(request):
+    match = request.resolver_match
+    if match is None:
+        return 'unmatched'
+    return match.view_name if match.url_name else match.route
+
+
+def observe(request, response, duration, metrics):
+    route = route_of(request)
+    REQUEST_SECONDS.observe(
+        (('route', route), ('method', request.method)), duration
+    )
+    if not response.streaming:
+        RESPONSE_BYTES.observe((('route', route),), len(response.content))
+    if metrics is None:
+        return
+    labels = (('route', route),)
+    SQL_QUERIES.observe(labels, metrics.queries)
+    SQL_SECONDS.observe(labels, metrics.timings['db'])
+    if 'serializer' in metrics.timings:
+        SERIALIZER_SECONDS.observe(labels, metrics.timings['serializer'])
+    repeated = metrics.repeated()
+    if repeated:
+        N_PLUS_ONE.increment(labels)
+        sql, count = max(repeated.items(), key=lambda item: item[1])
+        logger.warning('Возможный N+1 в %s: %s раз %s', route, count, sql)
+
+
+def server_timing(duration, metrics):
+    entries = [f'total;dur={duration * 1000:.1f}']
+    if metrics is not None:
+        entries.append(
+            f'db;dur={metrics.timings["db"] * 1000:.1f};'
+            f'desc="{metrics.queries} queries"'
+        )
+        entries.extend(
+            f'{name};dur={value * 1000:.1f}'
+            for name, value in metrics.timings.items() if name != 'db'
+        )
+        repeated = metrics.repeated()
+        if repeated:
+            entries.append(f'n-plus-one;desc="{len(repeated)} repeated"')
+    return ', '.join(entries)
+
+
+def metrics_view(request):
+    """Метрики процесса для Prometheus, доступ по METRICS_TOKEN"""
+    header = request.headers.get('Authorization', '')
+    if not secrets.compare_digest(
+        header.encode(), f'Bearer {settings.METRICS_TOKEN}'.encode()
+    ):
+        return HttpResponseForbidden()
+    lines = [line for metric in REGISTRY for line in metric.render()]
+    return HttpResponse(
+        '\n'.join(lines) + '\n',
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
@@ -0,0 +1,66 @@
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .metrics import RequestMetrics, current, observe, server_timing
+
+
+class MetricsMiddleware:
+    """Время ответа и размер для всех запросов, а для доли
+    METRICS_SAMPLE_RATE ещё число и время запросов к базе, время
+    сериализации и рендера и повторяющиеся запросы"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        started, token = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics = current.get()
+            current.reset(token)
+        return self.finish(request, response, started, metrics)
+
+    async def __acall__(self, request):
+        started, token = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics = current.get()
+            current.reset(token)
+        return self.finish(request, response, started, metrics)
+
+    @staticmethod
+    def start():
+        sampled = random.random() < settings.METRICS_SAMPLE_RATE
+        token = current.set(RequestMetrics() if sampled else None)
+        return time.perf_counter(), token
+
+    @staticmethod
+    def finish(request, response, started, metrics):
+        duration = time.perf_counter() - started
+        observe(request, response, duration, metrics)
+        response['Server-Timing'] = server_timing(duration, metrics)
+        return response
+
+    def process_template_response(self, request, response):
+        """Ответы DRF рендерятся после представления, замеряем отдельно"""
+        metrics = current.get()
+        if metrics is not None:
+            started = time.perf_counter()
+
+            def rendered(response):
+                metrics.timings['render'] += time.perf_counter() - started
+
+            response.add_post_render_callback(rendered)
+        return response
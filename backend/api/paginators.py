@@ -1,7 +1,124 @@
+import base64
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class CachedCountPaginator(Paginator):
+    """Пагинатор, кэширующий COUNT(*) на PAGINATION_COUNT_CACHE_TIMEOUT"""
+
+    @cached_property
+    def count(self):
+        timeout = settings.PAGINATION_COUNT_CACHE_TIMEOUT
+        if not timeout:
+            return super().count
+        try:
+            sql = str(self.object_list.query)
+        except Exception:
+            return super().count
+        key = f'count:{hashlib.md5(sql.encode()).hexdigest()}'
+        count = cache.get(key)
+        if count is None:
+            count = super().count
+            cache.set(key, count, timeout)
+        return count
 
 
 class LimitPagePagination(PageNumberPagination):
-    """Cписок первых шести или limit рецептов"""
+    """Cписок первых шести или limit рецептов
+
+    С параметром cursor вместо номера страницы используется курсор по
+    полям cursor_ordering представления, без OFFSET и COUNT(*).
+    """
     page_size_query_param = 'limit'
     page_size = 6
+    cursor_query_param = 'cursor'
+    django_paginator_class = CachedCountPaginator
+    invalid_cursor_message = 'Некорректный курсор'
+
+    def use_cursor(self, request):
+        return self.cursor_query_param in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.use_cursor(request)
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        ordering = getattr(view, 'cursor_ordering', ('id',))
+        queryset = queryset.order_by(*ordering)
+        position = self.decode_cursor(request, queryset.model, ordering)
+        if position:
+            queryset = queryset.filter(self.after(ordering, position))
+        page_size = self.get_page_size(request)
+        page = list(queryset[:page_size + 1])
+        self.next_position = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            self.next_position = [
+                getattr(page[-1], field.lstrip('-')) for field in ordering
+            ]
+        return page
+
+    @staticmethod
+    def after(ordering, position):
+        """Условие «строго после курсора» для составного ключа"""
+        condition = Q()
+        equal = Q()
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def decode_cursor(self, request, model, ordering):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            if len(values) != len(ordering):
+                raise ValueError
+            return [
+                model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(ordering, values)
+            ]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if self.next_position is None:
+            return None
+        cursor = base64.urlsafe_b64encode(json.dumps([
+            value.isoformat() if hasattr(value, 'isoformat') else value
+            for value in self.next_position
+        ]).encode()).decode()
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param, cursor
+        )
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+
+class CursorPagination(LimitPagePagination):
+    """Всегда курсор: для лент, где номер страницы не нужен"""
+
+    def use_cursor(self, request):
+        return True
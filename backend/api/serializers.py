@@ -1,5 +1,11 @@
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from rest_framework import serializers
 from rest_framework.serializers import SerializerMethodField
 from drf_extra_fields.fields import Base64ImageField
@@ -7,37 +13,60 @@ from drf_extra_fields.fields import Base64ImageField
 from users.serializers import (
     CustomUserSerializer
 )
+from .cache import recipe_fragment_keys
+from .metrics import TimedSerializerMixin, timed
+from recipes.images import RENDITIONS
 from recipes.models import (
     Ingredient,
     IngredientToRecipe,
     Recipe,
+    ShoppingListItem,
     Tag,
 )
 
 User = get_user_model()
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Выводим все поля тэгов"""
     class Meta:
         model = Tag
-        fields = '__all__'
+        exclude = ('updated',)
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin,
+                           serializers.ModelSerializer):
     """Выводим все поля ингридиентов"""
     class Meta:
         model = Ingredient
-        fields = '__all__'
+        exclude = ('updated',)
+
 
+class RecipeImagesMixin(serializers.Serializer):
+    """Ссылки на уменьшенные копии картинки рецепта"""
+    images = serializers.SerializerMethodField()
 
-class RecipeShortSerializer(serializers.ModelSerializer):
+    def get_images(self, obj):
+        """Пока копии не готовы, отдаём оригинал"""
+        request = self.context.get('request')
+        images = {}
+        for field in RENDITIONS:
+            image = getattr(obj, field) or obj.image
+            url = image.url if image else None
+            if url and request is not None:
+                url = request.build_absolute_uri(url)
+            images[field.replace('image_', '')] = url
+        return images
+
+
+class RecipeShortSerializer(TimedSerializerMixin, RecipeImagesMixin,
+                            serializers.ModelSerializer):
     """Краткая информация о рецепте"""
     image = Base64ImageField()
 
     class Meta:
         model = Recipe
-        fields = 'id', 'name', 'image', 'cooking_time'
+        fields = 'id', 'name', 'image', 'images', 'cooking_time'
         read_only_fields = ('__all__',)
 
 
@@ -64,7 +93,14 @@ class IngredientRecipeSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeListSerializer(serializers.ListSerializer):
+    """Список рецептов: кэш собирается одним запросом на страницу"""
+    def to_representation(self, data):
+        with timed('serializer'):
+            return self.child.represent_many(list(data))
+
+
+class RecipeSerializer(RecipeImagesMixin, serializers.ModelSerializer):
     """Сериалайзер вывода для рецепта"""
     tags = TagSerializer(many=True, read_only=True)
     ingredients = serializers.SerializerMethodField()
@@ -75,6 +111,7 @@ class RecipeSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Recipe
+        list_serializer_class = RecipeListSerializer
         fields = ('id',
                   'tags',
                   'author',
@@ -83,13 +120,88 @@ class RecipeSerializer(serializers.ModelSerializer):
                   'is_in_shopping_cart',
                   'name',
                   'image',
+                  'images',
                   'text',
                   'cooking_time'
                   )
 
+    def to_representation(self, instance):
+        with timed('serializer'):
+            return self.represent_many([instance])[0]
+
+    def represent_many(self, recipes):
+        """Общая для всех часть берётся из кэша, флаги считаются для
+        текущего пользователя"""
+        for recipe in recipes:
+            if hasattr(recipe, 'is_subscribed'):
+                recipe.author.is_subscribed = recipe.is_subscribed
+        fragments = self.shared_fragments(recipes)
+        return [
+            self.add_viewer_flags(recipe, fragments[recipe.id])
+            for recipe in recipes
+        ]
+
+    def shared_fragments(self, recipes):
+        """Общие части рецептов по id; в кэше в памяти процесса не
+        хранятся — правку в одном воркере не увидели бы остальные"""
+        if not settings.RECIPE_FRAGMENT_CACHE:
+            return self.build_fragments(recipes)
+        request = self.context.get('request')
+        keys = recipe_fragment_keys(recipes, request.get_host())
+        cached = cache.get_many(keys.values())
+        fragments = {
+            recipe.id: cached[keys[recipe.id]]
+            for recipe in recipes if keys[recipe.id] in cached
+        }
+        missing = [recipe for recipe in recipes if recipe.id not in fragments]
+        if missing:
+            fresh = self.build_fragments(missing)
+            cache.set_many(
+                {keys[pk]: data for pk, data in fresh.items()},
+                settings.RECIPE_CACHE_TIMEOUT
+            )
+            fragments.update(fresh)
+        return fragments
+
+    def build_fragments(self, recipes):
+        prefetch_related_objects(
+            recipes,
+            'tags',
+            Prefetch(
+                'ingredient_recipe',
+                queryset=IngredientToRecipe.objects.select_related(
+                    'ingredient'
+                )
+            ),
+        )
+        return {
+            recipe.id: self.shared_representation(recipe)
+            for recipe in recipes
+        }
+
+    def shared_representation(self, instance):
+        """Представление рецепта без флагов пользователя"""
+        data = super().to_representation(instance)
+        data['is_favorited'] = None
+        data['is_in_shopping_cart'] = None
+        data['author']['is_subscribed'] = None
+        return data
+
+    def add_viewer_flags(self, instance, shared):
+        data = dict(shared)
+        data['author'] = dict(
+            shared['author'],
+            is_subscribed=self.fields['author'].get_is_subscribed(
+                instance.author
+            )
+        )
+        data['is_favorited'] = self.get_is_favorited(instance)
+        data['is_in_shopping_cart'] = self.get_is_in_shopping_cart(instance)
+        return data
+
     def get_ingredients(self, obj):
         """Ингридиенты для рецепта"""
-        ingredients = IngredientToRecipe.objects.filter(recipe=obj)
+        ingredients = obj.ingredient_recipe.all()
         return IngredientRecipeSerializer(ingredients, many=True).data
 
     def get_is_favorited(self, obj):
@@ -97,14 +209,39 @@ class RecipeSerializer(serializers.ModelSerializer):
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
-        return Recipe.objects.filter(favorites__user=user, id=obj.id).exists()
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
+        return obj.favorites.filter(user=user).exists()
 
     def get_is_in_shopping_cart(self, obj):
         """Находится ли рецепт в списке покупок"""
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
-        return Recipe.objects.filter(cart__user=user, id=obj.id).exists()
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
+        return obj.cart.filter(user=user).exists()
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """Список id рецептов для массовых операций"""
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BULK_RECIPES_LIMIT,
+    )
+
+
+@contextmanager
+def unique_name():
+    """Повтор названия у автора ловит ограничение unique_name_author"""
+    try:
+        with transaction.atomic():
+            yield
+    except IntegrityError:
+        raise serializers.ValidationError(
+            {'name': 'Такой рецепт уже существует'}
+        )
 
 
 class CreateRecipeSerializer(serializers.ModelSerializer):
@@ -131,53 +268,106 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
 
     def validate(self, data):
         """Корректность заполнения/редактирования рецепта"""
-        ingredients = self.initial_data.get('ingredients')
+        ingredients = data.get('ingredients')
         tags = self.initial_data.get('tags')
         if not ingredients or not tags:
             raise ValidationError('Некорректные данные')
         request = self.context.get('request')
-        name = self.initial_data.get('name')
-        if Recipe.objects.filter(name=name).exists() and \
-                request.method == 'POST':
-            raise ValidationError('Такой рецепт уже существует')
         data.update(
             {
                 'tags': tags,
-                'ingredients': ingredients,
+                'ingredients': self.resolve_ingredients(ingredients),
                 'author': request.user
             }
         )
         return data
 
+    def resolve_ingredients(self, ingredients):
+        """Проверка ингредиентов одним запросом"""
+        amounts = {}
+        for ingredient in ingredients:
+            if ingredient['id'] in amounts:
+                raise ValidationError('Ингредиенты не должны повторяться')
+            amounts[ingredient['id']] = ingredient['amount']
+        existing = Ingredient.objects.in_bulk(amounts.keys())
+        unknown = [pk for pk in amounts if pk not in existing]
+        if unknown:
+            raise ValidationError(
+                f'Ингредиенты не найдены: {", ".join(map(str, unknown))}'
+            )
+        return amounts
+
+    @transaction.atomic
     def create(self, validated_data):
         """Создание рецепта"""
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
         image = validated_data.pop('image')
-        recipe = Recipe.objects.create(image=image, **validated_data)
+        with unique_name():
+            recipe = Recipe.objects.create(image=image, **validated_data)
         recipe.tags.set(tags)
         self.create_ingredients_to_recipe(ingredients, recipe)
         return recipe
 
     def create_ingredients_to_recipe(self, ingredients, recipe):
         """Связь ингридиентов и рецепта"""
-        for ingredient in ingredients:
-            IngredientToRecipe.objects.create(
+        IngredientToRecipe.objects.bulk_create(
+            IngredientToRecipe(
                 recipe=recipe,
-                ingredient=Ingredient.objects.get(id=ingredient['id']),
-                amount=ingredient.get('amount'),
+                ingredient_id=ingredient_id,
+                amount=amount,
             )
+            for ingredient_id, amount in ingredients.items()
+        )
 
+    def update_ingredients_to_recipe(self, ingredients, recipe):
+        """Применение изменений ингредиентов рецепта"""
+        current = {
+            link.ingredient_id: link
+            for link in IngredientToRecipe.objects.filter(recipe=recipe)
+        }
+        removed = [
+            link.id for ingredient_id, link in current.items()
+            if ingredient_id not in ingredients
+        ]
+        deltas = {
+            ingredient_id: -link.amount
+            for ingredient_id, link in current.items()
+            if ingredient_id not in ingredients
+        }
+        changed = []
+        for ingredient_id, amount in ingredients.items():
+            link = current.get(ingredient_id)
+            if link is None:
+                deltas[ingredient_id] = amount
+            elif link.amount != amount:
+                deltas[ingredient_id] = amount - link.amount
+                link.amount = amount
+                changed.append(link)
+        if removed:
+            IngredientToRecipe.objects.filter(id__in=removed).delete()
+        if changed:
+            IngredientToRecipe.objects.bulk_update(changed, ['amount'])
+        self.create_ingredients_to_recipe(
+            {
+                ingredient_id: amount
+                for ingredient_id, amount in ingredients.items()
+                if ingredient_id not in current
+            },
+            recipe
+        )
+        ShoppingListItem.objects.change_recipe(recipe, deltas)
+
+    @transaction.atomic
     def update(self, instance, validated_data):
         """Обновление рецепта"""
         tags = validated_data.pop('tags')
-        instance.tags.clear()
         instance.tags.set(tags)
         ingredients = validated_data.pop('ingredients')
-        IngredientToRecipe.objects.filter(recipe=instance).all().delete()
-        instance = super().update(instance, validated_data)
-        self.create_ingredients_to_recipe(ingredients, instance)
-        instance.save()
+        with unique_name():
+            instance = super().update(instance, validated_data)
+        self.update_ingredients_to_recipe(ingredients, instance)
+        Recipe.objects.filter(pk=instance.pk).update(similar_dirty=True)
         return instance
 
 
@@ -192,13 +382,11 @@ class FollowSerializer(CustomUserSerializer):
         read_only_fields = ('email', 'username', 'first_name', 'last_name')
 
     def get_recipes_count(self, obj):
-        return obj.recipes.count()
+        return obj.recipes_count
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        recipes = obj.recipes.all()
-        if limit:
-            recipes = recipes[: int(limit)]
+        recipes = getattr(obj, 'recipe_previews', None)
+        if recipes is None:
+            recipes = obj.recipes.all()[:self.context.get('recipes_limit')]
         serializer = RecipeShortSerializer(recipes, many=True, read_only=True)
         return serializer.data
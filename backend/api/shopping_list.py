@@ -0,0 +1,132 @@
+import csv
+import json
+from io import BytesIO
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+CHUNK_SIZE = 8192
+PDF_FONT = 'ShoppingListFont'
+PDF_FONT_SIZE = 12
+PDF_MARGIN = 50
+
+
+class Echo:
+    """Буфер для csv.writer, возвращающий записанную строку"""
+    def write(self, value):
+        return value
+
+
+def buffered(chunks, size=CHUNK_SIZE):
+    """Склеивает мелкие фрагменты в блоки для отправки клиенту"""
+    buffer = []
+    length = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer = []
+            length = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def ingredient_line(ingredient):
+    return (f'- {ingredient["ingredient__name"]} '
+            f'({ingredient["ingredient__measurement_unit"]})'
+            f' - {ingredient["amount"]}')
+
+
+def render_txt(title, ingredients):
+    """Список покупок в виде текста"""
+    yield f'{title}\n\n'
+    for number, ingredient in enumerate(ingredients):
+        yield ('\n' if number else '') + ingredient_line(ingredient)
+
+
+def render_csv(title, ingredients):
+    """Список покупок в формате csv"""
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for ingredient in ingredients:
+        yield writer.writerow((
+            ingredient['ingredient__name'],
+            ingredient['ingredient__measurement_unit'],
+            ingredient['amount'],
+        ))
+
+
+def render_json(title, ingredients):
+    """Список покупок в формате json"""
+    yield f'{{"title": {json.dumps(title, ensure_ascii=False)}, '
+    yield '"ingredients": ['
+    for number, ingredient in enumerate(ingredients):
+        yield (', ' if number else '') + json.dumps({
+            'name': ingredient['ingredient__name'],
+            'measurement_unit': ingredient['ingredient__measurement_unit'],
+            'amount': ingredient['amount'],
+        }, ensure_ascii=False)
+    yield ']}'
+
+
+def register_pdf_font():
+    """Шрифт с кириллицей для pdf, если он есть в системе"""
+    if PDF_FONT in pdfmetrics.getRegisteredFontNames():
+        return PDF_FONT
+    try:
+        pdfmetrics.registerFont(
+            TTFont(PDF_FONT, settings.SHOPPING_LIST_PDF_FONT)
+        )
+    except Exception:
+        return 'Helvetica'
+    return PDF_FONT
+
+
+def render_pdf(title, ingredients):
+    """Список покупок в формате pdf
+
+    Pdf собирается целиком, поэтому отдаётся после агрегации.
+    """
+    buffer = BytesIO()
+    font = register_pdf_font()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    top = height - PDF_MARGIN
+    pdf.setFont(font, PDF_FONT_SIZE)
+    pdf.drawString(PDF_MARGIN, top, title)
+    y = top - PDF_FONT_SIZE * 3
+    for ingredient in ingredients:
+        if y < PDF_MARGIN:
+            pdf.showPage()
+            pdf.setFont(font, PDF_FONT_SIZE)
+            y = top
+        pdf.drawString(PDF_MARGIN, y, ingredient_line(ingredient))
+        y -= PDF_FONT_SIZE * 1.5
+    pdf.save()
+    yield buffer.getvalue()
+
+
+SHOPPING_LIST_FORMATS = {
+    'txt': ('text/plain; charset=utf-8', render_txt),
+    'csv': ('text/csv; charset=utf-8', render_csv),
+    'json': ('application/json', render_json),
+    'pdf': ('application/pdf', render_pdf),
+}
+
+
+def shopping_list_response(user, ingredients, file_format):
+    """Потоковая выгрузка списка покупок в нужном формате"""
+    content_type, render = SHOPPING_LIST_FORMATS[file_format]
+    title = f'Список покупок для: {user.get_full_name()}'
+    content = render(title, ingredients)
+    if file_format != 'pdf':
+        content = buffered(content)
+    response = StreamingHttpResponse(content, content_type=content_type)
+    filename = f'{user.username}_shopping_list.{file_format}'
+    response['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
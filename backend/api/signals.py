@@ -0,0 +1,57 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.models import Ingredient, IngredientToRecipe, Recipe, Tag
+from .cache import bump_catalogue_version, bump_version
+
+User = get_user_model()
+
+
+def bump_on_commit(name):
+    transaction.on_commit(lambda: bump_version(name))
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_catalogue_cache(sender, **kwargs):
+    """Сбросить кэш справочника после изменения в админке"""
+    bump_catalogue_version(sender)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def invalidate_recipe_cache(instance, **kwargs):
+    """Сбросить кэш рецепта после его изменения"""
+    bump_on_commit(f'recipe:{instance.id}')
+
+
+@receiver((post_save, post_delete), sender=IngredientToRecipe)
+def invalidate_recipe_ingredients_cache(instance, **kwargs):
+    """Сбросить кэш рецепта после изменения его ингредиентов"""
+    bump_on_commit(f'recipe:{instance.recipe_id}')
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags_cache(instance, action, reverse, pk_set, **kwargs):
+    """Сбросить кэш рецептов после изменения их тэгов"""
+    if not reverse:
+        if action.startswith('post_'):
+            bump_on_commit(f'recipe:{instance.id}')
+        return
+    if action == 'pre_clear':
+        recipe_ids = list(instance.recipes.values_list('id', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        recipe_ids = pk_set
+    else:
+        return
+    for recipe_id in recipe_ids:
+        bump_on_commit(f'recipe:{recipe_id}')
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_cache(instance, update_fields, **kwargs):
+    """Сбросить кэш рецептов автора после изменения его данных"""
+    if update_fields and set(update_fields) == {'last_login'}:
+        return
+    bump_on_commit(f'user:{instance.id}')
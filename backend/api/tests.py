@@ -0,0 +1,881 @@
+import csv
+import json
+from importlib import import_module, reload
+from unittest import mock
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import AsyncClient, TestCase, override_settings
+from django.urls import clear_url_caches
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import (
+    Cart,
+    Favorite,
+    Ingredient,
+    IngredientToRecipe,
+    Recipe,
+    ShoppingListItem,
+    Tag,
+)
+from recipes.search import ingredient_index
+from users.models import Follow
+from .serializers import CreateRecipeSerializer
+
+User = get_user_model()
+
+
+def make_user(name):
+    return User.objects.create(
+        username=name, email=f'{name}@example.com',
+        first_name=name, last_name=name, password=name
+    )
+
+
+class RecipeListQueriesTest(TestCase):
+    """Число запросов списка рецептов не зависит от размера страницы"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user('reader')
+        authors = [make_user(f'author-{number}') for number in range(3)]
+        tags = [
+            Tag.objects.create(
+                name=f'тэг {number}', slug=f'tag-{number}',
+                color=f'#00000{number}'
+            )
+            for number in range(2)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(4)
+        ]
+        for number in range(12):
+            recipe = Recipe.objects.create(
+                author=authors[number % len(authors)],
+                name=f'рецепт {number}',
+                text='Описание',
+                cooking_time=10,
+                image='recipes/test.png',
+            )
+            recipe.tags.set(tags[:number % len(tags) + 1])
+            IngredientToRecipe.objects.bulk_create(
+                IngredientToRecipe(
+                    recipe=recipe, ingredient=ingredient, amount=number + 1
+                )
+                for ingredient in ingredients[:number % 3 + 2]
+            )
+            if number % 2:
+                Favorite.objects.create(user=cls.user, recipe=recipe)
+            if number % 3:
+                Cart.objects.create(user=cls.user, recipe=recipe)
+        Follow.objects.create(user=cls.user, author=authors[0])
+
+    def setUp(self):
+        cache.clear()
+        self.anonymous = APIClient()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertListQueries(self, client, queries):
+        for limit in (3, 6):
+            cache.clear()
+            with self.subTest(limit=limit), self.assertNumQueries(queries):
+                response = client.get(f'/api/recipes/?limit={limit}')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['results']), limit)
+
+    def test_anonymous(self):
+        # COUNT, страница с авторами, тэги, ингредиенты
+        self.assertListQueries(self.anonymous, 4)
+
+    def test_authenticated(self):
+        # флаги пользователя приходят в том же запросе, что и страница
+        self.assertListQueries(self.client, 4)
+
+    def test_flags(self):
+        """Флаги текущего пользователя совпадают с его избранным,
+        корзиной и подписками"""
+        response = self.client.get('/api/recipes/?limit=12')
+        for recipe in response.data['results']:
+            number = int(recipe['name'].split()[-1])
+            self.assertEqual(recipe['is_favorited'], bool(number % 2))
+            self.assertEqual(recipe['is_in_shopping_cart'], bool(number % 3))
+            self.assertEqual(
+                recipe['author']['is_subscribed'],
+                recipe['author']['username'] == 'author-0'
+            )
+
+
+class BulkObjsTest(TestCase):
+    """Массовые избранное и корзина меняют счётчики и список покупок
+    ровно один раз"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user('reader')
+        cls.flour = Ingredient.objects.create(
+            name='мука', measurement_unit='г'
+        )
+        cls.recipes = []
+        for number in range(3):
+            recipe = Recipe.objects.create(
+                author=cls.user, name=f'рецепт {number}', text='Описание',
+                cooking_time=10, image='recipes/test.png'
+            )
+            IngredientToRecipe.objects.create(
+                recipe=recipe, ingredient=cls.flour, amount=100
+            )
+            cls.recipes.append(recipe)
+        cls.ids = [recipe.id for recipe in cls.recipes]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def bulk(self, method, path, ids):
+        response = getattr(self.client, method)(
+            f'/api/recipes/{path}/', {'recipes': ids}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        return [result['status'] for result in response.data['results']]
+
+    def counts(self, field):
+        return list(Recipe.objects.filter(id__in=self.ids).order_by(
+            'id'
+        ).values_list(field, flat=True))
+
+    def flour_total(self):
+        item = ShoppingListItem.objects.filter(
+            user=self.user, ingredient=self.flour
+        ).first()
+        return item.total_amount if item else 0
+
+    def test_favorites(self):
+        Favorite.objects.create(user=self.user, recipe=self.recipes[0])
+        Favorite.objects.create(user=make_user('other'),
+                                recipe=self.recipes[1])
+        self.assertEqual(
+            self.bulk('post', 'bulk_favorite', self.ids + [10 ** 6]),
+            ['exists', 'added', 'added', 'not_found']
+        )
+        self.assertEqual(self.counts('favorites_count'), [1, 2, 1])
+        self.assertEqual(
+            self.bulk('delete', 'bulk_favorite', self.ids[1:]),
+            ['removed', 'removed']
+        )
+        self.assertEqual(self.counts('favorites_count'), [1, 1, 0])
+        self.assertEqual(
+            self.bulk('delete', 'bulk_favorite', self.ids[1:]),
+            ['absent', 'absent']
+        )
+        self.assertEqual(self.counts('favorites_count'), [1, 1, 0])
+
+    def test_cart(self):
+        self.bulk('post', 'bulk_shopping_cart', self.ids)
+        self.assertEqual(self.counts('cart_count'), [1, 1, 1])
+        self.assertEqual(self.flour_total(), 300)
+        self.bulk('delete', 'bulk_shopping_cart', self.ids[:1])
+        self.assertEqual(self.counts('cart_count'), [0, 1, 1])
+        self.assertEqual(self.flour_total(), 200)
+        response = self.client.delete('/api/recipes/clear_shopping_cart/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.counts('cart_count'), [0, 0, 0])
+        self.assertEqual(self.flour_total(), 0)
+
+
+class ShoppingListSyncTest(TestCase):
+    """Список покупок совпадает с корзинами, как бы они ни менялись"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user('reader')
+        cls.other = make_user('other')
+        cls.flour, cls.milk, cls.eggs = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('мука', 'молоко', 'яйца')
+        )
+        cls.pancakes = cls.make_recipe(
+            'блины', {cls.flour: 200, cls.milk: 500, cls.eggs: 2}
+        )
+        cls.pie = cls.make_recipe('пирог', {cls.flour: 300, cls.eggs: 3})
+
+    @classmethod
+    def make_recipe(cls, name, amounts):
+        recipe = Recipe.objects.create(
+            author=cls.other, name=name, text='Описание', cooking_time=10,
+            image='recipes/test.png'
+        )
+        IngredientToRecipe.objects.bulk_create(
+            IngredientToRecipe(recipe=recipe, ingredient=ingredient,
+                               amount=amount)
+            for ingredient, amount in amounts.items()
+        )
+        return recipe
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertInSync(self):
+        expected = {
+            (user_id, ingredient_id): total
+            for user_id, ingredient_id, total
+            in ShoppingListItem.objects.live_totals()
+        }
+        self.assertEqual(expected, {
+            (user_id, ingredient_id): total
+            for user_id, ingredient_id, total
+            in ShoppingListItem.objects.values_list(
+                'user_id', 'ingredient_id', 'total_amount'
+            )
+        })
+        return expected
+
+    def cart_path(self, recipe):
+        return f'/api/recipes/{recipe.id}/shopping_cart/'
+
+    def test_single_add_and_delete(self):
+        self.client.post(self.cart_path(self.pancakes))
+        self.client.post(self.cart_path(self.pie))
+        totals = self.assertInSync()
+        self.assertEqual(totals[self.user.id, self.flour.id], 500)
+        self.client.delete(self.cart_path(self.pancakes))
+        totals = self.assertInSync()
+        self.assertEqual(totals[self.user.id, self.flour.id], 300)
+        self.assertNotIn((self.user.id, self.milk.id), totals)
+
+    def test_repeated_add(self):
+        # двойной клик: второй POST упирается в уникальность и ничего
+        # не меняет
+        for action in ('favorite', 'shopping_cart'):
+            path = f'/api/recipes/{self.pancakes.id}/{action}/'
+            with self.subTest(action):
+                self.assertEqual(self.client.post(path).status_code, 201)
+                response = self.client.post(path)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.data['errors'],
+                                 'Рецепт уже добавлен')
+        self.pancakes.refresh_from_db()
+        self.assertEqual(
+            (self.pancakes.favorites_count, self.pancakes.cart_count), (1, 1)
+        )
+        self.assertEqual(Favorite.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(Cart.objects.filter(user=self.user).count(), 1)
+        totals = self.assertInSync()
+        self.assertEqual(totals[self.user.id, self.flour.id], 200)
+
+    def test_recipe_update(self):
+        self.client.post(self.cart_path(self.pancakes))
+        client = APIClient()
+        client.force_authenticate(self.other)
+        response = client.patch(
+            f'/api/recipes/{self.pancakes.id}/',
+            {
+                'name': 'блины', 'text': 'Описание', 'cooking_time': 10,
+                'tags': [Tag.objects.create(name='завтрак', slug='breakfast',
+                                            color='#000001').id],
+                'ingredients': [{'id': self.flour.id, 'amount': 250},
+                                {'id': self.eggs.id, 'amount': 2}],
+            },
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        totals = self.assertInSync()
+        self.assertEqual(totals[self.user.id, self.flour.id], 250)
+
+    def test_update_ingredients(self):
+        Cart.objects.create(user=self.user, recipe=self.pancakes)
+        Cart.objects.create(user=self.user, recipe=self.pie)
+        Cart.objects.create(user=self.other, recipe=self.pancakes)
+        salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+        links = {
+            link.ingredient_id: link.id
+            for link in IngredientToRecipe.objects.filter(
+                recipe=self.pancakes
+            )
+        }
+        with mock.patch.object(
+            ShoppingListItem.objects, 'change_recipe',
+            wraps=ShoppingListItem.objects.change_recipe
+        ) as change_recipe:
+            # молоко убрали, муку изменили, яйца не тронули, соль новая
+            CreateRecipeSerializer().update_ingredients_to_recipe(
+                {self.flour.id: 250, self.eggs.id: 2, salt.id: 5},
+                self.pancakes
+            )
+        change_recipe.assert_called_once_with(self.pancakes, {
+            self.milk.id: -500, self.flour.id: 50, salt.id: 5,
+        })
+        current = {
+            link.ingredient_id: (link.id, link.amount)
+            for link in IngredientToRecipe.objects.filter(
+                recipe=self.pancakes
+            )
+        }
+        self.assertEqual(current, {
+            self.flour.id: (links[self.flour.id], 250),
+            self.eggs.id: (links[self.eggs.id], 2),
+            salt.id: (current[salt.id][0], 5),
+        })
+        self.assertEqual(self.assertInSync(), {
+            (self.user.id, self.flour.id): 550,
+            (self.user.id, self.eggs.id): 5,
+            (self.user.id, salt.id): 5,
+            (self.other.id, self.flour.id): 250,
+            (self.other.id, self.eggs.id): 2,
+            (self.other.id, salt.id): 5,
+        })
+
+    def test_admin_changes(self):
+        # админка и ORM меняют корзину мимо представлений
+        Cart.objects.create(user=self.user, recipe=self.pancakes)
+        Cart.objects.create(user=self.user, recipe=self.pie)
+        Cart.objects.create(user=self.other, recipe=self.pie)
+        self.assertInSync()
+        Cart.objects.filter(user=self.user, recipe=self.pie).delete()
+        self.assertInSync()
+        self.pancakes.delete()
+        totals = self.assertInSync()
+        self.assertEqual(
+            totals, {(self.other.id, self.flour.id): 300,
+                     (self.other.id, self.eggs.id): 3}
+        )
+        self.other.delete()
+        self.assertEqual(self.assertInSync(), {})
+
+    def test_recipe_delete_through_api(self):
+        Cart.objects.create(user=self.user, recipe=self.pancakes)
+        client = APIClient()
+        client.force_authenticate(self.other)
+        response = client.delete(f'/api/recipes/{self.pancakes.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.assertInSync(), {})
+
+
+class ShoppingListDownloadTest(TestCase):
+    """Выгрузка списка покупок в каждом формате"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user('reader')
+        amounts = {
+            Ingredient.objects.create(name=name, measurement_unit=unit):
+            amount
+            for name, unit, amount in (
+                ('яйца', 'шт', 2), ('мука', 'г', 200), ('молоко', 'мл', 500)
+            )
+        }
+        recipe = Recipe.objects.create(
+            author=cls.user, name='блины', text='Описание', cooking_time=10,
+            image='recipes/test.png'
+        )
+        IngredientToRecipe.objects.bulk_create(
+            IngredientToRecipe(recipe=recipe, ingredient=ingredient,
+                               amount=amount)
+            for ingredient, amount in amounts.items()
+        )
+        Cart.objects.create(user=cls.user, recipe=recipe)
+        cls.title = 'Список покупок для: reader reader'
+        cls.rows = [
+            ('молоко', 'мл', 500), ('мука', 'г', 200), ('яйца', 'шт', 2)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def download(self, file_format, content_type):
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/', {'format': file_format}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], content_type)
+        self.assertEqual(
+            response['Content-Disposition'],
+            f'attachment; filename=reader_shopping_list.{file_format}'
+        )
+        return b''.join(response.streaming_content)
+
+    def test_txt(self):
+        body = self.download('txt', 'text/plain; charset=utf-8').decode()
+        self.assertEqual(body, f'{self.title}\n\n' + '\n'.join(
+            f'- {name} ({unit}) - {amount}'
+            for name, unit, amount in self.rows
+        ))
+
+    def test_csv(self):
+        body = self.download('csv', 'text/csv; charset=utf-8').decode()
+        self.assertEqual(list(csv.reader(body.splitlines())), [
+            ['name', 'measurement_unit', 'amount'],
+            *([name, unit, str(amount)] for name, unit, amount in self.rows),
+        ])
+
+    def test_json(self):
+        body = self.download('json', 'application/json')
+        self.assertEqual(json.loads(body), {
+            'title': self.title,
+            'ingredients': [
+                {'name': name, 'measurement_unit': unit, 'amount': amount}
+                for name, unit, amount in self.rows
+            ],
+        })
+
+    def test_pdf(self):
+        body = self.download('pdf', 'application/pdf')
+        self.assertTrue(body.startswith(b'%PDF-'))
+        self.assertTrue(body.rstrip().endswith(b'%%EOF'))
+
+    def test_unsupported_format(self):
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/', {'format': 'xml'}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['errors'],
+                         'Доступные форматы: txt, csv, json, pdf')
+
+
+class TagsFilterTest(TestCase):
+    """Фильтр по тэгам проверяет слаги по базе"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user('reader')
+        breakfast, lunch = Tag.objects.bulk_create([
+            Tag(name='завтрак', slug='breakfast', color='#000001'),
+            Tag(name='обед', slug='lunch', color='#000002'),
+        ])
+        for name, tags in (
+            ('каша', [breakfast]),
+            ('суп', [lunch]),
+            ('омлет', [breakfast, lunch]),
+            ('компот', []),
+        ):
+            recipe = Recipe.objects.create(
+                author=cls.user, name=name, text='Описание',
+                cooking_time=10, image='recipes/test.png'
+            )
+            recipe.tags.set(tags)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def names(self, tags):
+        response = self.client.get('/api/recipes/', {'tags': tags})
+        self.assertEqual(response.status_code, 200)
+        return sorted(recipe['name'] for recipe in response.data['results'])
+
+    def test_any_tag_without_duplicates(self):
+        self.assertEqual(self.names(['breakfast']), ['каша', 'омлет'])
+        self.assertEqual(
+            self.names(['breakfast', 'lunch']), ['каша', 'омлет', 'суп']
+        )
+
+    def test_unknown_slug(self):
+        response = self.client.get('/api/recipes/', {'tags': ['dinner']})
+        self.assertEqual(response.status_code, 400)
+
+    def test_tag_from_another_process(self):
+        self.names(['breakfast'])
+        # bulk_create без сигналов, как загрузка в другом процессе
+        dinner, = Tag.objects.bulk_create([
+            Tag(name='ужин', slug='dinner', color='#000003')
+        ])
+        Recipe.objects.get(name='компот').tags.add(dinner)
+        self.assertEqual(self.names(['dinner']), ['компот'])
+
+
+class CursorPaginationTest(TestCase):
+    """Курсор проходит список до конца без пропусков и повторов"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user('reader')
+        author = make_user('author')
+        Follow.objects.create(user=cls.user, author=author)
+        for number in range(8):
+            Recipe.objects.create(
+                author=author, name=f'рецепт {number}', text='Описание',
+                cooking_time=10, image='recipes/test.png',
+                popularity=number % 3
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def walk(self, path):
+        ids = []
+        while path:
+            response = self.client.get(path)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 3)
+            ids += [recipe['id'] for recipe in response.data['results']]
+            path = response.data['next']
+        return ids
+
+    def test_walk_to_the_end(self):
+        for ordering, fields in (
+            ('', ('-pub_date', '-id')),
+            ('popular', ('-popularity', '-id')),
+        ):
+            with self.subTest(ordering=ordering):
+                expected = list(Recipe.objects.order_by(
+                    *fields
+                ).values_list('id', flat=True))
+                self.assertEqual(self.walk(
+                    f'/api/recipes/?cursor=&limit=3&ordering={ordering}'
+                ), expected)
+
+    def test_feed(self):
+        self.assertEqual(
+            self.walk('/api/recipes/feed/?limit=3'),
+            list(Recipe.objects.order_by('-pub_date', '-id').values_list(
+                'id', flat=True
+            ))
+        )
+
+    def test_malformed_cursor(self):
+        for cursor in ('!!!', 'WzFd', 'bm90IGpzb24='):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(f'/api/recipes/?cursor={cursor}')
+                self.assertEqual(response.status_code, 404)
+
+    def test_search_with_cursor(self):
+        response = self.client.get('/api/recipes/?search=рецепт&cursor=')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/recipes/?search=рецепт&page=1')
+        self.assertEqual(response.status_code, 200)
+
+
+class CatalogueCacheTest(TestCase):
+    """ETag справочника одинаков во всех процессах и меняется вместе с
+    базой"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user('reader')
+        Tag.objects.create(name='завтрак', slug='breakfast', color='#000001')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_not_modified(self):
+        etag = self.client.get('/api/tags/')['ETag']
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_does_not_depend_on_process_cache(self):
+        etag = self.client.get('/api/tags/')['ETag']
+        # у другого воркера свой пустой кэш
+        cache.clear()
+        self.assertEqual(self.client.get('/api/tags/')['ETag'], etag)
+
+    def test_change_from_another_process(self):
+        etag = self.client.get('/api/tags/')['ETag']
+        # bulk_create не отправляет сигналов, как загрузка в другом процессе
+        Tag.objects.bulk_create([
+            Tag(name='обед', slug='lunch', color='#000002')
+        ])
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('lunch', [tag['slug'] for tag in response.data])
+
+
+class IngredientSearchTest(TestCase):
+    """Поиск ингредиентов по индексу в памяти"""
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г')
+            for name in ('ванильный сахар', 'Сахарная пудра', 'соль',
+                         'сахар тростниковый', 'сахар')
+        )
+
+    def setUp(self):
+        # индекс живёт в процессе и мог остаться от других тестов
+        ingredient_index.invalidate()
+
+    def search(self, **params):
+        return APIClient().get('/api/ingredients/', params)
+
+    def test_ranking(self):
+        response = self.search(name='Сахар')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [item['name'] for item in response.data],
+            ['сахар', 'сахар тростниковый', 'Сахарная пудра',
+             'ванильный сахар']
+        )
+
+    @override_settings(INGREDIENT_SEARCH_LIMIT=2)
+    def test_limit(self):
+        for limit, expected in (('1', 1), ('2', 2), ('100', 2), (None, 2)):
+            with self.subTest(limit=limit):
+                params = {'name': 'сахар'}
+                if limit is not None:
+                    params['limit'] = limit
+                self.assertEqual(len(self.search(**params).data), expected)
+
+    def test_bad_limit(self):
+        for limit in ('0', '-1', 'abc', '', '1.5'):
+            with self.subTest(limit=limit):
+                response = self.search(name='сахар', limit=limit)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.data['errors'],
+                                 'limit должен быть положительным числом')
+
+
+class RecipeFragmentCacheTest(TestCase):
+    """Общая часть рецепта кэшируется, только если кэш общий для
+    воркеров"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user('reader')
+        cls.recipe = Recipe.objects.create(
+            author=cls.user, name='старое', text='Описание',
+            cooking_time=10, image='recipes/test.png'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.path = f'/api/recipes/{self.recipe.id}/'
+
+    def rename_in_another_worker(self):
+        # update() без сигналов: версию в этом процессе никто не поднимет
+        Recipe.objects.filter(pk=self.recipe.pk).update(name='новое')
+
+    @override_settings(RECIPE_FRAGMENT_CACHE=False)
+    def test_process_cache_is_not_used(self):
+        self.client.get(self.path)
+        self.rename_in_another_worker()
+        self.assertEqual(self.client.get(self.path).data['name'], 'новое')
+
+    @override_settings(RECIPE_FRAGMENT_CACHE=True)
+    def test_shared_cache(self):
+        self.client.get(self.path)
+        self.rename_in_another_worker()
+        self.assertEqual(self.client.get(self.path).data['name'], 'старое')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.refresh_from_db()
+            self.recipe.save()
+        self.assertEqual(self.client.get(self.path).data['name'], 'новое')
+
+    @override_settings(RECIPE_FRAGMENT_CACHE=True)
+    def test_edit_through_api(self):
+        tag = Tag.objects.create(name='обед', slug='lunch', color='#000002')
+        salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+        reader = APIClient()
+        for client in (self.client, reader):
+            client.get(self.path)
+            client.get('/api/recipes/')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                self.path,
+                {
+                    'name': 'новое', 'text': 'Описание', 'cooking_time': 5,
+                    'tags': [tag.id],
+                    'ingredients': [{'id': salt.id, 'amount': 3}],
+                },
+                format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        for client in (self.client, reader):
+            for data in (
+                client.get(self.path).data,
+                client.get('/api/recipes/').data['results'][0],
+            ):
+                self.assertEqual(data['name'], 'новое')
+                self.assertEqual(data['cooking_time'], 5)
+                self.assertEqual([item['id'] for item in data['tags']],
+                                 [tag.id])
+                self.assertEqual(
+                    [(item['id'], item['amount'])
+                     for item in data['ingredients']],
+                    [(salt.id, 3)]
+                )
+
+
+def install_search_triggers():
+    """Тестовая база создаётся без миграций, триггеры search_document
+    ставим сами"""
+    if connection.vendor != 'postgresql':
+        return
+    migration = import_module(
+        'recipes.migrations.0006_recipe_search_document'
+    )
+    with connection.schema_editor() as schema_editor:
+        migration.create_triggers(None, schema_editor)
+
+
+class RecipeSearchTest(TestCase):
+    """Поиск по названию, описанию и ингредиентам с ранжированием"""
+
+    @classmethod
+    def setUpTestData(cls):
+        install_search_triggers()
+        cls.user = make_user('reader')
+        potato = Ingredient.objects.create(
+            name='картофель', measurement_unit='г'
+        )
+        for name, text, ingredients in (
+            ('Картофель печёный', 'Запечь в духовке', []),
+            ('Суп овощной', 'Варить час', [potato]),
+            ('Салат', 'Картофель отварить и остудить', []),
+            ('Компот', 'Варить из яблок', []),
+        ):
+            recipe = Recipe.objects.create(
+                author=cls.user, name=name, text=text, cooking_time=10,
+                image='recipes/test.png'
+            )
+            IngredientToRecipe.objects.bulk_create(
+                IngredientToRecipe(recipe=recipe, ingredient=ingredient,
+                                   amount=100)
+                for ingredient in ingredients
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def search(self, query):
+        response = self.client.get(
+            '/api/recipes/', {'search': query, 'limit': 10}
+        )
+        self.assertEqual(response.status_code, 200)
+        return [recipe['name'] for recipe in response.data['results']]
+
+    def test_ranking(self):
+        """Название весит больше ингредиентов, ингредиенты — больше
+        описания"""
+        self.assertEqual(self.search('картофель'), [
+            'Картофель печёный', 'Суп овощной', 'Салат'
+        ])
+
+    def test_all_words(self):
+        self.assertEqual(self.search('варить яблок'), ['Компот'])
+
+    def test_no_matches(self):
+        self.assertEqual(self.search('пирог'), [])
+
+    def test_blank_query(self):
+        self.assertEqual(len(self.search('  ')), 4)
+
+
+def reload_urls():
+    """urls.py подключает асинхронные виды по ASYNC_READ_VIEWS при
+    импорте"""
+    for module in ('api.urls', 'foodgram.urls'):
+        reload(import_module(module))
+    clear_url_caches()
+
+
+class AsyncViewsTest(TestCase):
+    """Асинхронные GET отдают то же, что синхронные виды"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user('reader')
+        cls.token = Token.objects.create(user=cls.user)
+        author = make_user('author')
+        Follow.objects.create(user=cls.user, author=author)
+        tags = [
+            Tag.objects.create(name=f'тэг {number}', slug=f'tag-{number}',
+                               color=f'#00000{number}')
+            for number in range(2)
+        ]
+        flour = Ingredient.objects.create(name='мука', measurement_unit='г')
+        for number in range(5):
+            recipe = Recipe.objects.create(
+                author=author if number % 2 else cls.user,
+                name=f'рецепт {number}', text='Описание', cooking_time=10,
+                image='recipes/test.png'
+            )
+            recipe.tags.set(tags[:number % 2 + 1])
+            IngredientToRecipe.objects.create(
+                recipe=recipe, ingredient=flour, amount=number + 1
+            )
+            if number % 3:
+                Favorite.objects.create(user=cls.user, recipe=recipe)
+        cls.recipe = recipe
+        cls.paths = [
+            '/api/recipes/', '/api/recipes/?limit=2&page=2',
+            f'/api/recipes/{recipe.id}/', '/api/tags/',
+            '/api/ingredients/?name=му',
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.auth = {'Authorization': f'Token {self.token.key}'}
+
+    def sync_responses(self, headers):
+        client = APIClient()
+        return {
+            path: client.get(path, headers=headers).json()
+            for path in self.paths
+        }
+
+    @override_settings(ASYNC_READ_VIEWS=True)
+    async def async_responses(self, headers):
+        client = AsyncClient()
+        responses = {}
+        for path in self.paths:
+            response = await client.get(path, headers=headers)
+            self.assertEqual(response.status_code, 200, path)
+            responses[path] = response.json()
+        return responses
+
+    def compare(self, headers=None):
+        expected = self.sync_responses(headers)
+        with override_settings(ASYNC_READ_VIEWS=True):
+            reload_urls()
+        self.addCleanup(reload_urls)
+        cache.clear()
+        actual = async_to_sync(self.async_responses)(headers)
+        for path in self.paths:
+            with self.subTest(path=path):
+                self.assertEqual(actual[path], expected[path])
+
+    def test_anonymous(self):
+        self.compare()
+
+    def test_authenticated(self):
+        self.compare(self.auth)
+
+    @override_settings(ASYNC_READ_VIEWS=True)
+    async def test_invalid_token(self):
+        await sync_to_async(reload_urls)()
+        self.addCleanup(reload_urls)
+        client = AsyncClient()
+        for path in self.paths:
+            with self.subTest(path=path):
+                response = await client.get(
+                    path, headers={'Authorization': 'Token invalid'}
+                )
+                self.assertEqual(response.status_code, 401)
+
+    @override_settings(ASYNC_READ_VIEWS=True)
+    async def test_not_modified(self):
+        await sync_to_async(reload_urls)()
+        self.addCleanup(reload_urls)
+        client = AsyncClient()
+        etag = (await client.get('/api/tags/'))['ETag']
+        response = await client.get(
+            '/api/tags/', headers={'If-None-Match': etag}
+        )
+        self.assertEqual(response.status_code, 304)
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
@@ -12,7 +13,29 @@ router.register('ingredients', IngredientsViewSet, 'ingredients')
 router.register('recipes', RecipeViewSet, 'recipes')
 router.register('users', CustomUserViewSet, 'users')
 
-urlpatterns = [
+urlpatterns = []
+
+if settings.ASYNC_READ_VIEWS:
+    from .async_views import (
+        ingredient_list,
+        recipe_detail,
+        recipe_list,
+        tag_list,
+    )
+
+    urlpatterns += [
+        path('recipes/', recipe_list),
+        path('recipes/<int:pk>/', recipe_detail),
+        path('ingredients/', ingredient_list),
+        path('tags/', tag_list),
+    ]
+
+if settings.METRICS_TOKEN:
+    from .metrics import metrics_view
+
+    urlpatterns.append(path('metrics/', metrics_view))
+
+urlpatterns += [
     path('', include(router.urls)),
     path('', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
@@ -1,23 +1,31 @@
-from django.http import HttpResponse
-from django.db.models import Sum
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, F, OuterRef
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.status import HTTP_400_BAD_REQUEST
 from rest_framework.viewsets import ReadOnlyModelViewSet, ModelViewSet
 
-from api.paginators import LimitPagePagination
+from api.paginators import CursorPagination, LimitPagePagination
+from users.models import Follow
+from recipes.search import ingredient_index
+from recipes.counters import manual_counters, update_counters_many
+from recipes.feed import feed_filter
 from recipes.models import (
     Tag,
     Ingredient,
     Recipe,
     Favorite,
     Cart,
-    IngredientToRecipe,
+    ShoppingListItem,
 )
+from .cache import CatalogueCacheMixin
 from .permissions import (
     IsOwnerOrReadOnly,
     IsAdminOrReadOnly,
@@ -27,28 +35,67 @@ from .serializers import (
     IngredientSerializer,
     RecipeSerializer,
     RecipeShortSerializer,
-    CreateRecipeSerializer
-)
-from .filters import (
-    IngredientFilter,
-    RecipeFilter
+    CreateRecipeSerializer,
+    RecipeIdsSerializer,
 )
+from .filters import RECIPE_ORDERINGS, RecipeFilter
+from .shopping_list import SHOPPING_LIST_FORMATS, shopping_list_response
+
+User = get_user_model()
+
+
+def ingredient_search_limit(query_params):
+    """limit поиска ингредиентов или None, если он некорректен"""
+    limit = query_params.get('limit')
+    if limit is None:
+        return settings.INGREDIENT_SEARCH_LIMIT
+    if not limit.isdigit() or int(limit) < 1:
+        return None
+    return min(int(limit), settings.INGREDIENT_SEARCH_LIMIT)
 
 
-class TagsViewSet(ReadOnlyModelViewSet):
+def recipe_queryset(user):
+    """Рецепты с автором и флагами пользователя"""
+    queryset = Recipe.objects.select_related('author')
+    if user.is_anonymous:
+        return queryset
+    return queryset.annotate(
+        is_favorited=Exists(Favorite.objects.filter(
+            user=user, recipe=OuterRef('pk')
+        )),
+        is_in_shopping_cart=Exists(Cart.objects.filter(
+            user=user, recipe=OuterRef('pk')
+        )),
+        is_subscribed=Exists(Follow.objects.filter(
+            user=user, author=OuterRef('author')
+        )),
+    )
+
+
+class TagsViewSet(CatalogueCacheMixin, ReadOnlyModelViewSet):
     """Обрабатывает тэги"""
     queryset = Tag.objects.all()
     permission_classes = (IsAdminOrReadOnly,)
     serializer_class = TagSerializer
 
 
-class IngredientsViewSet(ReadOnlyModelViewSet):
+class IngredientsViewSet(CatalogueCacheMixin, ReadOnlyModelViewSet):
     """Обрабатывает ингридиенты"""
     queryset = Ingredient.objects.all()
     permission_classes = (IsAdminOrReadOnly,)
     serializer_class = IngredientSerializer
-    filter_backends = (DjangoFilterBackend,)
-    filterset_class = IngredientFilter
+
+    def list(self, request, *args, **kwargs):
+        """Поиск ингредиентов по названию без запросов к базе"""
+        name = request.query_params.get('name')
+        if not name:
+            return super().list(request, *args, **kwargs)
+        limit = ingredient_search_limit(request.query_params)
+        if limit is None:
+            return Response({
+                'errors': 'limit должен быть положительным числом'
+            }, status=HTTP_400_BAD_REQUEST)
+        return Response(ingredient_index.search(name, limit))
 
 
 class RecipeViewSet(ModelViewSet):
@@ -59,6 +106,24 @@ class RecipeViewSet(ModelViewSet):
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
+    @property
+    def cursor_ordering(self):
+        """Ключ курсора совпадает с выбранной сортировкой
+
+        Результаты поиска упорядочены по релевантности, которой нет в
+        ключе курсора, поэтому листаются только по страницам.
+        """
+        if self.request.query_params.get('search', '').strip():
+            raise ValidationError({
+                'cursor': 'Результаты поиска листаются параметром page'
+            })
+        return RECIPE_ORDERINGS.get(
+            self.request.query_params.get('ordering'), ('-pub_date', '-id')
+        )
+
+    def get_queryset(self):
+        return recipe_queryset(self.request.user)
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
@@ -87,21 +152,143 @@ class RecipeViewSet(ModelViewSet):
             return self.delete_obj(Cart, request.user, pk)
         return None
 
+    @action(detail=False, permission_classes=[IsAuthenticated])
+    def feed(self, request):
+        """Рецепты авторов из подписок пользователя"""
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            feed_filter(request.user)
+        )
+        paginator = CursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=True)
+    def similar(self, request, pk):
+        """Похожие рецепты из заранее посчитанной таблицы"""
+        recipes = list(self.get_queryset().filter(
+            neighbour_of__recipe_id=pk
+        ).order_by('-neighbour_of__score', 'id'))
+        if not recipes:
+            get_object_or_404(Recipe, id=pk)
+        serializer = self.get_serializer(recipes, many=True)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['post', 'delete'],
+            permission_classes=[IsAuthenticated])
+    def bulk_favorite(self, request):
+        """Добавить/удалить несколько рецептов из избранного"""
+        return self.bulk_objs(Favorite, request)
+
+    @action(detail=False, methods=['post', 'delete'],
+            permission_classes=[IsAuthenticated])
+    def bulk_shopping_cart(self, request):
+        """Добавить/удалить несколько рецептов из списка покупок"""
+        return self.bulk_objs(Cart, request)
+
+    @action(detail=False, methods=['delete'],
+            permission_classes=[IsAuthenticated])
+    @transaction.atomic
+    def clear_shopping_cart(self, request):
+        """Очистить список покупок"""
+        self.remove_objs(Cart, request.user, Cart.objects.filter(
+            user=request.user
+        ))
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @staticmethod
+    def lock_user(user):
+        """Изменения избранного и корзины одного пользователя идут по
+        очереди, иначе параллельные запросы посчитают строку дважды"""
+        User.objects.select_for_update().only('id').get(pk=user.pk)
+
     def add_obj(self, model, user, pk):
-        if model.objects.filter(user=user, recipe__id=pk).exists():
+        recipe = get_object_or_404(Recipe, id=pk)
+        # повтор ловит уникальный индекс; ON CONFLICT DO NOTHING обошёл бы
+        # post_save, который ведёт счётчики и список покупок
+        try:
+            with transaction.atomic():
+                self.lock_user(user)
+                model.objects.create(user=user, recipe=recipe)
+        except IntegrityError:
             return Response({
                 'errors': 'Рецепт уже добавлен'
             }, status=status.HTTP_400_BAD_REQUEST)
-        recipe = get_object_or_404(Recipe, id=pk)
-        model.objects.create(user=user, recipe=recipe)
         serializer = RecipeShortSerializer(recipe)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @transaction.atomic
     def delete_obj(self, model, user, pk):
+        self.lock_user(user)
         object = model.objects.filter(user=user, recipe__id=pk)
         object.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    def bulk_objs(self, model, request):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = list(dict.fromkeys(serializer.validated_data['recipes']))
+        if request.method == 'POST':
+            results = self.add_objs(model, request.user, ids)
+        else:
+            removed = self.remove_objs(
+                model, request.user,
+                model.objects.filter(user=request.user, recipe_id__in=ids)
+            )
+            results = {
+                pk: 'removed' if pk in removed else 'absent' for pk in ids
+            }
+        return Response({'results': [
+            {'id': pk, 'status': results[pk]} for pk in ids
+        ]})
+
+    @transaction.atomic
+    def add_objs(self, model, user, ids):
+        """Один INSERT с пропуском уже добавленных рецептов"""
+        self.lock_user(user)
+        present = dict(Recipe.objects.filter(id__in=ids).annotate(
+            present=Exists(model.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            ))
+        ).values_list('id', 'present'))
+        added = [
+            model(user=user, recipe_id=pk)
+            for pk in ids if present.get(pk) is False
+        ]
+        if added:
+            model.objects.bulk_create(added, ignore_conflicts=True)
+            update_counters_many(model, added, 1)
+            if model is Cart:
+                ShoppingListItem.objects.add_recipes(
+                    user, [obj.recipe_id for obj in added]
+                )
+        return {
+            pk: 'not_found' if pk not in present
+            else 'exists' if present[pk] else 'added'
+            for pk in ids
+        }
+
+    @transaction.atomic
+    def remove_objs(self, model, user, objs):
+        """Один DELETE, счётчики и список покупок правим сами"""
+        self.lock_user(user)
+        removed = set(objs.values_list('recipe_id', flat=True))
+        if removed:
+            with manual_counters():
+                objs.filter(recipe_id__in=removed).delete()
+            update_counters_many(
+                model, [model(recipe_id=pk) for pk in removed], -1
+            )
+            if model is Cart:
+                ShoppingListItem.objects.remove_recipes(user, removed)
+        return removed
+
+    def perform_content_negotiation(self, request, force=False):
+        """Параметр format выгрузки списка покупок обрабатываем сами"""
+        if self.action == 'download_shopping_cart':
+            force = True
+        return super().perform_content_negotiation(request, force)
+
     @action(detail=False, methods=['get'],
             permission_classes=[IsAuthenticated])
     def download_shopping_cart(self, request):
@@ -109,23 +296,19 @@ class RecipeViewSet(ModelViewSet):
         user = request.user
         if not user.cart.exists():
             return Response(status=HTTP_400_BAD_REQUEST)
-        filename = f'{user.username}_shopping_list.txt'
-        ingredients = IngredientToRecipe.objects.filter(
-            recipe__cart__user=request.user
+        file_format = request.query_params.get('format', 'txt')
+        if file_format not in SHOPPING_LIST_FORMATS:
+            return Response({
+                'errors': 'Доступные форматы: '
+                          f'{", ".join(SHOPPING_LIST_FORMATS)}'
+            }, status=HTTP_400_BAD_REQUEST)
+        ingredients = ShoppingListItem.objects.filter(
+            user=user
         ).values(
             'ingredient__name',
-            'ingredient__measurement_unit'
-        ).annotate(amount=Sum('amount'))
-        shopping_list = (
-            f'Список покупок для: {user.get_full_name()}\n\n'
+            'ingredient__measurement_unit',
+            amount=F('total_amount')
+        ).order_by('ingredient__name')
+        return shopping_list_response(
+            user, ingredients.iterator(), file_format
         )
-        shopping_list += '\n'.join([
-            f'- {ingredient["ingredient__name"]} '
-            f'({ingredient["ingredient__measurement_unit"]})'
-            f' - {ingredient["amount"]}'
-            for ingredient in ingredients
-        ])
-        response = HttpResponse(shopping_list, content_type='text/plain')
-        response['Content-Disposition'] = f'attachment; filename={filename}'
-
-        return response
@@ -19,6 +19,21 @@ CSRF_TRUSTED_ORIGINS = ["http://localhost", "http://127.0.0.1", "https://kvasty.
 
 MAX_LENGTH = 100
 
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', 50))
+
+INGREDIENT_SEARCH_INDEX_TTL = int(os.getenv('INGREDIENT_SEARCH_INDEX_TTL', 300))
+
+RECIPE_SEARCH_INDEX_TTL = int(os.getenv('RECIPE_SEARCH_INDEX_TTL', 60))
+
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+
+IMAGE_QUALITY = int(os.getenv('IMAGE_QUALITY', 80))
+
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
 INSTALLED_APPS = [
     'django.contrib.admin',
     'django.contrib.auth',
@@ -36,6 +51,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -72,10 +88,55 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', default='postgres'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='postgres'),
         'HOST': os.getenv('DB_HOST', default='127.0.0.1'),
-        'PORT': os.getenv('DB_PORT', default='5432')
+        'PORT': os.getenv('DB_PORT', default='5432'),
+        # пула соединений нет: каждый поток держит своё соединение
+        # CONN_MAX_AGE секунд и перед запросом проверяет, что оно живо
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True',
+        # история миграций users и api не применяется к пустой базе,
+        # тестовая база создаётся сразу по моделям
+        'TEST': {'MIGRATE': False},
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'foodgram'),
+    }
+}
+
+CATALOGUE_CACHE_TIMEOUT = int(os.getenv('CATALOGUE_CACHE_TIMEOUT', 300))
+
+RECIPE_CACHE_TIMEOUT = int(os.getenv('RECIPE_CACHE_TIMEOUT', 3600))
+
+# Фрагменты рецептов и их версии кэшируются, только если кэш общий для воркеров
+RECIPE_FRAGMENT_CACHE = CACHES['default']['BACKEND'].rsplit('.', 1)[-1] not in ('LocMemCache', 'DummyCache')
+
+SUBSCRIPTION_RECIPES_LIMIT = int(os.getenv('SUBSCRIPTION_RECIPES_LIMIT', 50))
+
+BULK_RECIPES_LIMIT = int(os.getenv('BULK_RECIPES_LIMIT', 100))
+
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', 'False') == 'True'
+
+FEED_TIMELINE_THRESHOLD = int(os.getenv('FEED_TIMELINE_THRESHOLD', 100))
+
+FEED_TIMELINE_SIZE = int(os.getenv('FEED_TIMELINE_SIZE', 1000))
+
+RECIPE_POPULAR_HALF_LIFE_DAYS = float(os.getenv('RECIPE_POPULAR_HALF_LIFE_DAYS', 30))
+
+RECIPE_TRENDING_HALF_LIFE_DAYS = float(os.getenv('RECIPE_TRENDING_HALF_LIFE_DAYS', 1))
+
+SIMILAR_RECIPES_COUNT = int(os.getenv('SIMILAR_RECIPES_COUNT', 10))
+
+METRICS_SAMPLE_RATE = float(os.getenv('METRICS_SAMPLE_RATE', 0.1))
+
+METRICS_N_PLUS_ONE_THRESHOLD = int(os.getenv('METRICS_N_PLUS_ONE_THRESHOLD', 5))
+
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+PAGINATION_COUNT_CACHE_TIMEOUT = int(os.getenv('PAGINATION_COUNT_CACHE_TIMEOUT', 0))
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
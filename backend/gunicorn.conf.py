@@ -0,0 +1,25 @@
+import multiprocessing
+import os
+
+# С ASYNC_READ_VIEWS приложение запускается под ASGI воркерами uvicorn
+asgi = os.getenv('ASYNC_READ_VIEWS', 'False') == 'True'
+wsgi_app = os.getenv(
+    'GUNICORN_APP',
+    'foodgram.asgi:application' if asgi else 'foodgram.wsgi:application'
+)
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:9000')
+workers = int(os.getenv(
+    'GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1
+))
+threads = int(os.getenv('GUNICORN_THREADS', 1))
+if asgi:
+    default_worker_class = 'uvicorn.workers.UvicornWorker'
+elif threads > 1:
+    default_worker_class = 'gthread'
+else:
+    default_worker_class = 'sync'
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', default_worker_class)
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 2))
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 0))
@@ -8,8 +8,10 @@ class RecipeAdmin(admin.ModelAdmin):
     list_display = ('name', 'author', 'count_favorites')
     list_filter = ('author', 'name', 'tags')
 
+    @admin.display(description='в избранном',
+                   ordering='favorites_count')
     def count_favorites(self, obj):
-        return obj.favorites.count()
+        return obj.favorites_count
 
 
 class IngredientAdmin(admin.ModelAdmin):
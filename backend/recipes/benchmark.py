@@ -0,0 +1,135 @@
+import secrets
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.test.utils import override_settings
+
+from users.models import Follow
+from .counters import COUNTERS, recount
+from .models import (
+    Cart,
+    Favorite,
+    Ingredient,
+    IngredientToRecipe,
+    Recipe,
+    ShoppingListItem,
+    Tag,
+)
+from .similarity import rebuild_similar
+
+User = get_user_model()
+
+BATCH_SIZE = 5000
+
+
+class Rollback(Exception):
+    pass
+
+
+@contextmanager
+def rolled_back():
+    """Транзакция с отдельным кэшем, которая всегда откатывается
+
+    Кэш подменяется, чтобы версии и фрагменты для временных id не
+    остались в настоящем кэше после отката.
+    """
+    try:
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'benchmark',
+        }}):
+            cache.clear()
+            with transaction.atomic():
+                yield
+                raise Rollback
+    except Rollback:
+        pass
+
+
+def make_users(count, prefix):
+    names = [f'{prefix}-{number}' for number in range(count)]
+    return User.objects.bulk_create(
+        User(username=name, email=f'{name}@example.com', password=name,
+             first_name=name, last_name=name)
+        for name in names
+    )
+
+
+def seed_dataset(users, recipes, ingredients=5, follows=10):
+    """Пользователи, рецепты с ингредиентами, избранное, корзины и подписки
+
+    Строки пишутся через bulk_create, поэтому счётчики, списки покупок и
+    таблица похожих рецептов пересчитываются в конце.
+    """
+    prefix = f'bench-{secrets.token_hex(4)}'
+    users = make_users(max(users, 2), prefix)
+    tags = Tag.objects.bulk_create(
+        Tag(name=f'{prefix}-{number}', slug=f'{prefix}-{number}',
+            color=f'#{secrets.token_hex(3)}')
+        for number in range(5)
+    )
+    catalogue = Ingredient.objects.bulk_create(
+        Ingredient(name=f'{prefix} ингредиент {number}',
+                   measurement_unit='г')
+        for number in range(max(ingredients * 4, 20))
+    )
+    created = Recipe.objects.bulk_create(
+        (Recipe(author=users[number % len(users)],
+                name=f'{prefix} рецепт {number}', text='Описание рецепта',
+                cooking_time=number % 60 + 1, image='recipes/benchmark.png')
+         for number in range(recipes)),
+        batch_size=BATCH_SIZE,
+    )
+    Recipe.tags.through.objects.bulk_create(
+        (Recipe.tags.through(recipe_id=recipe.id,
+                             tag_id=tags[number % len(tags)].id)
+         for number, recipe in enumerate(created)),
+        batch_size=BATCH_SIZE,
+    )
+    IngredientToRecipe.objects.bulk_create(
+        (IngredientToRecipe(
+            recipe=recipe,
+            ingredient=catalogue[(number + shift) % len(catalogue)],
+            amount=shift + 1,
+        ) for number, recipe in enumerate(created)
+            for shift in range(ingredients)),
+        batch_size=BATCH_SIZE,
+    )
+    # каждый третий рецепт в избранном и в корзине у одного пользователя,
+    # чтобы фильтр по обоим флагам не отдавал пустую страницу
+    Favorite.objects.bulk_create(
+        (Favorite(user=users[(number + 1) % len(users)], recipe=recipe)
+         for number, recipe in enumerate(created)),
+        batch_size=BATCH_SIZE,
+    )
+    Cart.objects.bulk_create(
+        (Cart(user=users[(number + 1 + bool(number % 3)) % len(users)],
+              recipe=recipe)
+         for number, recipe in enumerate(created)),
+        batch_size=BATCH_SIZE,
+    )
+    Follow.objects.bulk_create(
+        (Follow(user=user, author=users[(number + shift) % len(users)])
+         for number, user in enumerate(users)
+         for shift in range(1, min(follows, len(users) - 1) + 1)),
+        batch_size=BATCH_SIZE,
+    )
+    for counter in COUNTERS:
+        recount(*counter)
+    totals = ShoppingListItem.objects.live_totals().filter(
+        recipe__cart__user__in=users
+    )
+    ShoppingListItem.objects.bulk_create(
+        (ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id,
+                          total_amount=total_amount)
+         for user_id, ingredient_id, total_amount in totals.iterator()),
+        batch_size=BATCH_SIZE,
+    )
+    rebuild_similar(settings.SIMILAR_RECIPES_COUNT)
+    return SimpleNamespace(
+        users=users, tags=tags, ingredients=catalogue, recipes=created
+    )
@@ -0,0 +1,83 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from users.models import Follow
+from .models import Cart, Favorite, Recipe
+
+User = get_user_model()
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'cart_count', Cart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'author'),
+    (User, 'subscriptions_count', Follow, 'user'),
+)
+
+
+counted_manually = ContextVar('counted_manually', default=False)
+
+
+@contextmanager
+def manual_counters():
+    """Счётчики и списки покупок правит вызывающий код, сигналы строк
+    их не трогают"""
+    token = counted_manually.set(True)
+    try:
+        yield
+    finally:
+        counted_manually.reset(token)
+
+
+def counter_changes(model, field, value):
+    """Новое значение счётчика; счётчики рецепта — избранное и корзина,
+    поэтому заодно отмечаем, что популярность нужно пересчитать"""
+    if model is Recipe:
+        return {field: value, 'score_dirty': True}
+    return {field: value}
+
+
+def update_counters(source, instance, delta):
+    """Изменяет счётчики, зависящие от строки source, на delta"""
+    update_counters_many(source, [instance], delta)
+
+
+def update_counters_many(source, instances, delta):
+    """То же для строк source, ссылающихся на разные объекты"""
+    for model, field, counted, fk in COUNTERS:
+        if counted is not source:
+            continue
+        queryset = model.objects.filter(pk__in=[
+            getattr(instance, f'{fk}_id') for instance in instances
+        ])
+        if delta < 0:
+            queryset = queryset.filter(**{f'{field}__gte': -delta})
+        queryset.update(**counter_changes(model, field, F(field) + delta))
+
+
+def actual_count(counted, fk):
+    return Coalesce(
+        Subquery(
+            counted.objects.filter(**{fk: OuterRef('pk')}).order_by().values(
+                fk
+            ).annotate(total=Count('pk')).values('total')
+        ),
+        Value(0)
+    )
+
+
+def recount(model, field, counted, fk):
+    """Исправляет расхождения счётчика, возвращает их количество"""
+    drifted = model.objects.annotate(
+        actual=actual_count(counted, fk)
+    ).exclude(**{field: F('actual')})
+    ids = list(drifted.values_list('pk', flat=True))
+    if ids:
+        model.objects.filter(pk__in=ids).update(
+            **counter_changes(model, field, actual_count(counted, fk))
+        )
+    return len(ids)
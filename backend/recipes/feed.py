@@ -0,0 +1,93 @@
+from django.conf import settings
+from django.db.models import Count, F, Q, Window
+from django.db.models.functions import RowNumber
+
+from users.models import Follow
+from .models import Recipe, TimelineEntry
+
+
+def uses_timeline(subscriptions_count):
+    """Ленту подписчика многих авторов читаем из готовой таблицы"""
+    return subscriptions_count >= settings.FEED_TIMELINE_THRESHOLD
+
+
+def feed_filter(user):
+    """Условие на рецепты ленты: join по подпискам или готовая лента"""
+    if uses_timeline(user.subscriptions_count):
+        return Q(timeline__user=user)
+    return Q(author__following__user=user)
+
+
+def fill_timeline(user_id, author_ids=None):
+    """Дописывает в ленту последние рецепты авторов из подписок"""
+    recipes = Recipe.objects.filter(author__following__user_id=user_id)
+    if author_ids is not None:
+        recipes = recipes.filter(author_id__in=author_ids)
+    recipe_ids = recipes.order_by('-pub_date', '-id').values_list(
+        'id', flat=True
+    )[:settings.FEED_TIMELINE_SIZE]
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, recipe_id=pk) for pk in recipe_ids),
+        ignore_conflicts=True,
+    )
+    if author_ids is not None:
+        trim_timelines([user_id])
+
+
+def trim_timelines(user_ids=None):
+    """Оставляет в лентах только FEED_TIMELINE_SIZE последних рецептов
+
+    Без user_ids обрезает все переполненные ленты, возвращает число
+    удалённых записей.
+    """
+    size = settings.FEED_TIMELINE_SIZE
+    if user_ids is None:
+        user_ids = TimelineEntry.objects.values('user_id').annotate(
+            count=Count('id')
+        ).filter(count__gt=size).values_list('user_id', flat=True)
+    surplus = TimelineEntry.objects.filter(user_id__in=user_ids).annotate(
+        position=Window(
+            RowNumber(),
+            partition_by=F('user_id'),
+            order_by=(F('recipe__pub_date').desc(), F('recipe_id').desc()),
+        )
+    ).filter(position__gt=size)
+    ids = list(surplus.values_list('id', flat=True))
+    if ids:
+        TimelineEntry.objects.filter(id__in=ids).delete()
+    return len(ids)
+
+
+def fan_out(recipe):
+    """Новый рецепт попадает в готовые ленты подписчиков автора
+
+    Ленты здесь не обрезаются: у популярного автора это было бы чтение
+    всех лент подписчиков внутри запроса. Самые старые записи сверх
+    FEED_TIMELINE_SIZE периодически удаляет trim_feed_timelines.
+    """
+    user_ids = Follow.objects.filter(
+        author_id=recipe.author_id,
+        user__subscriptions_count__gte=settings.FEED_TIMELINE_THRESHOLD,
+    ).values_list('user_id', flat=True)
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=pk, recipe=recipe) for pk in user_ids),
+        ignore_conflicts=True,
+        batch_size=1000,
+    )
+
+
+def follow_added(follow):
+    """Лента заводится, когда подписок становится достаточно"""
+    count = Follow.objects.filter(user_id=follow.user_id).count()
+    if not uses_timeline(count):
+        return
+    if count == settings.FEED_TIMELINE_THRESHOLD:
+        fill_timeline(follow.user_id)
+    else:
+        fill_timeline(follow.user_id, [follow.author_id])
+
+
+def follow_removed(follow):
+    TimelineEntry.objects.filter(
+        user_id=follow.user_id, recipe__author_id=follow.author_id
+    ).delete()
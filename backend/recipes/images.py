@@ -0,0 +1,94 @@
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from PIL import Image, ImageOps, features
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+RENDITIONS = {
+    'image_thumbnail': (240, 240),
+    'image_card': (600, 600),
+    'image_full': (1600, 1600),
+}
+
+executor = None
+
+
+def get_executor():
+    global executor
+    if executor is None:
+        executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_WORKERS,
+            thread_name_prefix='recipe-images',
+        )
+    return executor
+
+
+def encode(image):
+    """Сжатие в webp, если Pillow его поддерживает, иначе в jpeg"""
+    buffer = BytesIO()
+    if features.check('webp'):
+        image.save(buffer, 'WEBP', quality=settings.IMAGE_QUALITY)
+        return buffer.getvalue(), 'webp'
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    image.save(
+        buffer, 'JPEG', quality=settings.IMAGE_QUALITY, optimize=True
+    )
+    return buffer.getvalue(), 'jpg'
+
+
+def build_renditions(recipe_id):
+    """Уменьшенные копии картинки рецепта"""
+    try:
+        recipe = Recipe.objects.filter(pk=recipe_id).first()
+        if recipe is None or not recipe.image:
+            return
+        original = recipe.image.name
+        with recipe.image.open('rb') as file:
+            source = ImageOps.exif_transpose(Image.open(file))
+            source.load()
+        files = {}
+        for field, size in RENDITIONS.items():
+            image = source.copy()
+            image.thumbnail(size, Image.LANCZOS)
+            content, extension = encode(image)
+            files[field] = (f'{uuid.uuid4()}.{extension}', content)
+        with transaction.atomic():
+            recipe = Recipe.objects.select_for_update().filter(
+                pk=recipe_id, image=original
+            ).first()
+            if recipe is None:
+                return
+            for field, (name, content) in files.items():
+                getattr(recipe, field).save(
+                    name, ContentFile(content), save=False
+                )
+            recipe.save(update_fields=list(RENDITIONS))
+    except Exception:
+        logger.exception('Не удалось обработать картинку рецепта %s',
+                         recipe_id)
+
+
+def build_renditions_in_worker(recipe_id):
+    try:
+        build_renditions(recipe_id)
+    finally:
+        connection.close()
+
+
+def schedule_renditions(recipe_id):
+    """Поставить обработку картинки в очередь после коммита"""
+    if not settings.IMAGE_WORKERS:
+        transaction.on_commit(lambda: build_renditions(recipe_id))
+        return
+    transaction.on_commit(
+        lambda: get_executor().submit(build_renditions_in_worker, recipe_id)
+    )
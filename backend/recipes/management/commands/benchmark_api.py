@@ -0,0 +1,197 @@
+import gc
+import json
+import time
+import tracemalloc
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes.benchmark import rolled_back, seed_dataset
+from recipes.models import Tag
+
+DEFAULT_BASELINE = settings.BASE_DIR / 'benchmarks' / 'api.json'
+
+# GET-запросы из requests.http, id подставляются из сгенерированных данных
+SCENARIOS = {
+    'users_list': '/api/users/?page=1&limit=6',
+    'user_detail': '/api/users/{author}/',
+    'users_me': '/api/users/me/',
+    'subscriptions': '/api/users/subscriptions/?recipes_limit=3',
+    'tags_list': '/api/tags/',
+    'tag_detail': '/api/tags/{tag}/',
+    'recipes_list': '/api/recipes/?page=1&limit=6',
+    'recipes_filtered': ('/api/recipes/?is_favorited=1&is_in_shopping_cart=1'
+                         '&tags={tag_slug}'),
+    'recipes_by_author': '/api/recipes/?author={author}',
+    'recipes_cursor': '/api/recipes/?cursor=&limit=6',
+    'recipes_popular': '/api/recipes/?ordering=popular&cursor=&limit=6',
+    'recipes_feed': '/api/recipes/feed/',
+    'recipe_detail': '/api/recipes/{recipe}/',
+    'recipe_similar': '/api/recipes/{recipe}/similar/',
+    'ingredients_search': '/api/ingredients/?name={ingredient_prefix}',
+    'ingredient_detail': '/api/ingredients/{ingredient}/',
+    'download_shopping_cart': '/api/recipes/download_shopping_cart/',
+    'download_shopping_cart_csv': (
+        '/api/recipes/download_shopping_cart/?format=csv'
+    ),
+}
+
+# метрика, допустимый рост в долях и запас в единицах метрики. Время и
+# память зависят от машины и версии Python и только выводятся; размер
+# ответа меняется на разрядность id
+METRICS = {
+    'queries': (0, 0),
+    'payload_kb': (0.05, 1),
+}
+
+
+def percentile(values, share):
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+def consume(response):
+    """Потоковый ответ нужно дочитать, иначе замер неполный"""
+    if response.streaming:
+        return b''.join(response.streaming_content)
+    return response.content
+
+
+class Command(BaseCommand):
+    """Замер запросов, размера ответа, задержек и аллокаций по сценариям
+    API"""
+    help = ('Создаёт данные во временной транзакции, прогоняет сценарии '
+            'через тестовый клиент и сравнивает результат с baseline')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50,
+                            help='Количество пользователей')
+        parser.add_argument('--recipes', type=int, default=500,
+                            help='Количество рецептов')
+        parser.add_argument('--ingredients', type=int, default=8,
+                            help='Ингредиентов в рецепте')
+        parser.add_argument('--repeat', type=int, default=50,
+                            help='Повторов каждого сценария')
+        parser.add_argument('--scenario', action='append',
+                            choices=SCENARIOS,
+                            help='Только эти сценарии')
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE),
+                            help='Файл baseline в json')
+        parser.add_argument('--save', action='store_true',
+                            help='Записать результат как новый baseline')
+
+    def handle(self, *args, **options):
+        if min(options['users'], options['recipes'], options['repeat']) < 1:
+            raise CommandError('Параметры должны быть положительными')
+        with rolled_back():
+            data = seed_dataset(
+                options['users'], options['recipes'], options['ingredients']
+            )
+            user = data.users[0]
+            tag = Tag.objects.filter(
+                recipes__favorites__user=user, recipes__cart__user=user
+            ).first()
+            if tag is None:
+                raise CommandError(
+                    'Нет рецептов в избранном и корзине одновременно, '
+                    'увеличьте --recipes'
+                )
+            values = {
+                'author': data.users[1].id,
+                'tag': data.tags[0].id,
+                'tag_slug': tag.slug,
+                'recipe': data.recipes[-1].id,
+                'ingredient': data.ingredients[0].id,
+                'ingredient_prefix': data.ingredients[0].name[:12],
+            }
+            client = APIClient()
+            client.force_authenticate(user)
+            results = {
+                name: self.measure(
+                    client, SCENARIOS[name].format(**values),
+                    options['repeat']
+                )
+                for name in options['scenario'] or SCENARIOS
+            }
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name}: запросов {result["queries"]}, '
+                f'p50 {result["p50_ms"]} мс, p95 {result["p95_ms"]} мс, '
+                f'p99 {result["p99_ms"]} мс, ответ {result["payload_kb"]} КБ, '
+                f'аллокации {result["allocated_kb"]} КБ'
+            )
+        baseline = Path(options['baseline'])
+        if options['save']:
+            baseline.parent.mkdir(parents=True, exist_ok=True)
+            baseline.write_text(json.dumps(results, indent=2, sort_keys=True))
+            self.stdout.write(self.style.SUCCESS(f'Записан {baseline}'))
+            return
+        if not baseline.exists():
+            self.stdout.write(f'Нет {baseline}, запустите с --save')
+            return
+        regressions = self.compare(json.loads(baseline.read_text()), results)
+        if regressions:
+            raise CommandError('Регрессии: ' + '; '.join(regressions))
+        self.stdout.write(self.style.SUCCESS('Регрессий нет'))
+
+    def measure(self, client, path, repeat):
+        response = client.get(path)
+        payload = consume(response)
+        if response.status_code != 200:
+            raise CommandError(f'{path}: {response.status_code}')
+        if response.get('Content-Type') == 'application/json':
+            data = json.loads(payload)
+            if isinstance(data, dict) and data.get('results') == []:
+                raise CommandError(f'{path}: пустая страница')
+        # при DEBUG журнал запросов мог заполниться при создании данных
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            consume(client.get(path))
+        # журнал очищается следующими запросами, считаем сразу
+        executed = len(queries)
+        tracemalloc.start()
+        consume(client.get(path))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        timings = []
+        # как timeit: паузы сборщика мусора не относятся к сценарию
+        gc.collect()
+        gc.disable()
+        try:
+            for _ in range(repeat):
+                started = time.perf_counter()
+                consume(client.get(path))
+                timings.append(time.perf_counter() - started)
+        finally:
+            gc.enable()
+        timings.sort()
+        return {
+            'path': path,
+            'queries': executed,
+            'p50_ms': round(percentile(timings, 0.5) * 1000, 2),
+            'p95_ms': round(percentile(timings, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(timings, 0.99) * 1000, 2),
+            'payload_kb': round(len(payload) / 1024, 1),
+            'allocated_kb': round(peak / 1024, 1),
+        }
+
+    @staticmethod
+    def compare(baseline, results):
+        """Больше запросов — регрессия всегда, размер ответа — с допуском"""
+        regressions = []
+        for name, result in results.items():
+            expected = baseline.get(name)
+            if expected is None:
+                continue
+            for metric, (share, slack) in METRICS.items():
+                if metric not in expected:
+                    continue
+                limit = expected[metric] * (1 + share) + slack
+                if result[metric] > limit:
+                    regressions.append(
+                        f'{name}.{metric} {result[metric]} > {limit:g}'
+                    )
+        return regressions
@@ -0,0 +1,86 @@
+import secrets
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+
+from api.filters import RecipeFilter
+from recipes.benchmark import make_users, rolled_back
+from recipes.models import Recipe, Tag
+
+
+class Command(BaseCommand):
+    """Замер фильтра по тэгам на сгенерированных рецептах"""
+    help = ('Создаёт рецепты во временной транзакции и замеряет выдачу '
+            'первой страницы с фильтром по 1..N тэгам')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes',
+            type=int,
+            default=100000,
+            help='Количество рецептов',
+        )
+        parser.add_argument(
+            '--tags',
+            type=int,
+            default=8,
+            help='Количество тэгов',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Повторов каждого замера',
+        )
+
+    def handle(self, *args, **options):
+        if min(options['recipes'], options['tags'], options['repeat']) < 1:
+            raise CommandError('Параметры должны быть положительными')
+        with rolled_back():
+            self.seed(options['recipes'], options['tags'])
+            for count in range(1, options['tags'] + 1):
+                self.measure(count, options['repeat'])
+
+    def seed(self, recipes, tags):
+        prefix = f'benchmark-{secrets.token_hex(4)}'
+        author, = make_users(1, prefix)
+        self.slugs = [f'{prefix}-{number}' for number in range(tags)]
+        tags = Tag.objects.bulk_create(
+            Tag(name=slug, slug=slug, color=f'#{secrets.token_hex(3)}')
+            for slug in self.slugs
+        )
+        created = Recipe.objects.bulk_create(
+            (Recipe(author=author, name=f'benchmark {number}', text='-',
+                    cooking_time=1, image='recipes/benchmark.png')
+             for number in range(recipes)),
+            batch_size=5000,
+        )
+        Recipe.tags.through.objects.bulk_create(
+            (Recipe.tags.through(recipe_id=recipe.id,
+                                 tag_id=tags[number % len(tags)].id)
+             for number, recipe in enumerate(created)),
+            batch_size=5000,
+        )
+        self.stdout.write(f'Создано рецептов: {len(created)}')
+
+    def measure(self, count, repeat):
+        request = RequestFactory().get(
+            '/api/recipes/', {'tags': self.slugs[:count]}
+        )
+        request.user = AnonymousUser()
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            queryset = RecipeFilter(
+                request.GET, queryset=Recipe.objects.all(), request=request
+            ).qs
+            queryset.count()
+            list(queryset[:6])
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        self.stdout.write(
+            f'тэгов: {count}, медиана {timings[len(timings) // 2] * 1000:.1f}'
+            f' мс, максимум {timings[-1] * 1000:.1f} мс'
+        )
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import build_renditions
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """Создание уменьшенных копий для уже загруженных картинок"""
+    help = 'Создаёт уменьшенные копии картинок рецептов, у которых их нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересоздать копии для всех рецептов',
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(image_card='')
+        processed = 0
+        for recipe_id in recipes.values_list('id', flat=True).iterator():
+            build_renditions(recipe_id)
+            processed += 1
+        self.stdout.write(self.style.SUCCESS(f'Обработано: {processed}'))
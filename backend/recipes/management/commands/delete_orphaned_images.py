@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import delete_orphaned_images
+
+HOUR = 60 * 60
+
+
+class Command(BaseCommand):
+    """Удаление картинок, на которые не ссылается ни один рецепт"""
+    help = ('Удаляет файлы картинок и копий без рецептов, которые не '
+            'использовались дольше --grace-hours. Запускать периодически, '
+            'например из cron')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-hours',
+            type=float,
+            default=24,
+            help='Сколько часов хранить файл после последнего использования',
+        )
+
+    def handle(self, *args, **options):
+        if options['grace_hours'] <= 0:
+            raise CommandError('Параметры должны быть положительными')
+        deleted = delete_orphaned_images(options['grace_hours'] * HOUR)
+        self.stdout.write(self.style.SUCCESS(f'Удалено файлов: {deleted}'))
@@ -0,0 +1,119 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Exists, OuterRef
+
+from recipes.benchmark import rolled_back, seed_dataset
+from recipes.models import Cart, Favorite, Recipe, SimilarRecipe
+from users.models import Follow
+
+User = get_user_model()
+
+SEQUENTIAL_SCAN = {
+    'postgresql': r'Seq Scan on "?{table}"?\b',
+    'sqlite': r'\bSCAN "?{table}"?\s*$',
+}
+
+
+def is_full_scan(model, plan):
+    """План читает таблицу модели целиком"""
+    pattern = SEQUENTIAL_SCAN[connection.vendor].format(
+        table=re.escape(model._meta.db_table)
+    )
+    return re.search(pattern, plan, re.MULTILINE) is not None
+
+
+def hot_queries(user, recipe):
+    """Частые запросы API, которые должны идти по индексам"""
+    return {
+        'is_favorited': (
+            Favorite,
+            Recipe.objects.filter(favorites__user=user)[:6],
+        ),
+        'is_in_shopping_cart': (
+            Cart,
+            Recipe.objects.filter(cart__user=user)[:6],
+        ),
+        'favorites_of_recipe': (
+            Favorite,
+            Favorite.objects.filter(recipe=recipe, user=user),
+        ),
+        'is_subscribed': (
+            Follow,
+            Recipe.objects.annotate(is_subscribed=Exists(Follow.objects.filter(
+                user=user, author=OuterRef('author')
+            )))[:6],
+        ),
+        'subscriptions': (
+            Follow,
+            User.objects.filter(following__user=user).order_by('id')[:6],
+        ),
+        'followers': (
+            Follow,
+            Follow.objects.filter(author=recipe.author_id, user=user),
+        ),
+        'feed': (
+            Recipe,
+            Recipe.objects.order_by('-pub_date', '-id')[:6],
+        ),
+        'popular': (
+            Recipe,
+            Recipe.objects.order_by('-popularity', '-id')[:6],
+        ),
+        'trending': (
+            Recipe,
+            Recipe.objects.order_by('-trending', '-id')[:6],
+        ),
+        'similar': (
+            SimilarRecipe,
+            Recipe.objects.filter(neighbour_of__recipe=recipe).order_by(
+                '-neighbour_of__score', 'id'
+            ),
+        ),
+    }
+
+
+class Command(BaseCommand):
+    """Проверка планов частых запросов через EXPLAIN"""
+    help = ('Выводит планы частых запросов и завершается с ошибкой, '
+            'если какой-то из них читает таблицу целиком')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Создать столько рецептов во временной транзакции',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor not in SEQUENTIAL_SCAN:
+            raise CommandError(f'EXPLAIN не поддержан для {connection.vendor}')
+        with rolled_back():
+            if options['seed'] > 0:
+                seed_dataset(options['seed'] // 10, options['seed'])
+                if connection.vendor == 'postgresql':
+                    with connection.cursor() as cursor:
+                        cursor.execute('ANALYZE')
+            failed = self.check_plans()
+        if failed:
+            raise CommandError(f'Полное чтение таблицы: {", ".join(failed)}')
+        self.stdout.write(self.style.SUCCESS('Все запросы идут по индексам'))
+
+    def check_plans(self):
+        user = User.objects.order_by('-id').first()
+        recipe = Recipe.objects.order_by('-id').first()
+        if user is None or recipe is None:
+            raise CommandError('Нет данных, запустите с --seed')
+        failed = []
+        for name, (model, queryset) in hot_queries(user, recipe).items():
+            plan = queryset.explain()
+            full_scan = is_full_scan(model, plan)
+            if full_scan:
+                failed.append(name)
+            self.stdout.write(self.style.ERROR(name) if full_scan
+                              else self.style.SUCCESS(name))
+            self.stdout.write(plan)
+        return failed
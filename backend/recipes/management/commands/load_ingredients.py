@@ -0,0 +1,178 @@
+import csv
+import json
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.cache import bump_catalogue_version
+from recipes.models import Ingredient, Tag
+
+READ_CHUNK_SIZE = 65536
+
+MODELS = {
+    'ingredient': {
+        'model': Ingredient,
+        'fields': ('name', 'measurement_unit'),
+        'unique_fields': ('name', 'measurement_unit'),
+        'update_fields': ('measurement_unit', 'updated'),
+    },
+    'tag': {
+        'model': Tag,
+        'fields': ('name', 'color', 'slug'),
+        'unique_fields': ('slug',),
+        'update_fields': ('name', 'color', 'updated'),
+    },
+}
+
+
+def read_csv(file, fields):
+    """Строки csv по порядку полей, заголовок пропускается"""
+    for row in csv.reader(file):
+        if tuple(row) == fields:
+            continue
+        yield dict(zip(fields, row))
+
+
+def read_json(file, fields):
+    """Объекты из json-массива без чтения файла целиком"""
+    decoder = json.JSONDecoder()
+    buffer = file.read(READ_CHUNK_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидается json-массив объектов')
+    buffer = buffer[1:]
+    eof = False
+    while True:
+        buffer = buffer.lstrip().lstrip(',').lstrip()
+        if buffer.startswith(']'):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            if eof:
+                raise CommandError('Некорректный json')
+            chunk = file.read(READ_CHUNK_SIZE)
+            eof = not chunk
+            buffer += chunk
+            continue
+        yield item
+        buffer = buffer[end:]
+
+
+def read_jsonl(file, fields):
+    """Объекты из файла json lines"""
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+    '.jsonl': read_jsonl,
+}
+
+
+class Command(BaseCommand):
+    """Загрузка справочника ингредиентов или тэгов"""
+    help = 'Загружает ингредиенты или тэги из csv, json или jsonl'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=str(settings.BASE_DIR / 'data' / 'ingredients.csv'),
+            help='Файл с данными',
+        )
+        parser.add_argument(
+            '--model',
+            choices=MODELS,
+            default='ingredient',
+            help='Что загружаем: ингредиенты или тэги',
+        )
+        parser.add_argument(
+            '--format',
+            choices=[suffix[1:] for suffix in READERS],
+            help='Формат файла, по умолчанию по расширению',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество строк в одном запросе',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Прочитать и проверить файл без записи в базу',
+        )
+
+    def handle(self, *args, **options):
+        config = MODELS[options['model']]
+        path = Path(options['path'])
+        suffix = f'.{options["format"]}' if options['format'] else (
+            path.suffix.lower()
+        )
+        if suffix not in READERS:
+            raise CommandError(f'Неизвестный формат файла: {path.name}')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть положительным')
+        self.config = config
+        self.dry_run = options['dry_run']
+        self.started = time.monotonic()
+        self.loaded = 0
+        self.skipped = 0
+        batch = {}
+        with open(path, encoding='utf-8-sig', newline='') as file:
+            for row in READERS[suffix](file, config['fields']):
+                obj = self.build(row)
+                if obj is None:
+                    self.skipped += 1
+                    continue
+                key = tuple(
+                    getattr(obj, field) for field in config['unique_fields']
+                )
+                batch[key] = obj
+                if len(batch) >= options['batch_size']:
+                    self.save(batch)
+                    batch = {}
+        self.save(batch)
+        if not self.dry_run:
+            bump_catalogue_version(config['model'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Проверено" if self.dry_run else "Загружено"}: '
+            f'{self.loaded}, пропущено: {self.skipped}, '
+            f'{self.rate():.0f} строк/с'
+        ))
+
+    def build(self, row):
+        """Объект модели из строки файла или None для битой строки"""
+        values = {}
+        for field in self.config['fields']:
+            value = str(row.get(field) or '').strip()
+            max_length = self.config['model']._meta.get_field(
+                field
+            ).max_length
+            if not value or len(value) > max_length:
+                return None
+            values[field] = value
+        return self.config['model'](**values)
+
+    def save(self, batch):
+        if not batch:
+            return
+        if not self.dry_run:
+            self.config['model'].objects.bulk_create(
+                batch.values(),
+                update_conflicts=True,
+                unique_fields=self.config['unique_fields'],
+                update_fields=self.config['update_fields'],
+            )
+        self.loaded += len(batch)
+        self.stdout.write(
+            f'{self.loaded} строк, {self.rate():.0f} строк/с'
+        )
+
+    def rate(self):
+        return self.loaded / max(time.monotonic() - self.started, 1e-9)
@@ -0,0 +1,143 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection, connections
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client
+
+MODES = {
+    'close': 0,
+    'persistent': None,
+    'asgi': None,
+}
+
+
+def percentile(values, share):
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+class Command(BaseCommand):
+    """Нагрузочный замер открытия соединений с базой"""
+    help = ('Прогоняет запросы к API внутри процесса: WSGI с закрытием '
+            'соединения после каждого запроса, WSGI с постоянными '
+            'соединениями и ASGI с тем же числом одновременных запросов')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default='/api/recipes/',
+            help='Адрес, который запрашиваем',
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=500,
+            help='Количество запросов в каждом режиме',
+        )
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=4,
+            help='Количество потоков или одновременных запросов ASGI',
+        )
+        parser.add_argument(
+            '--mode',
+            choices=MODES,
+            action='append',
+            help='Режим, по умолчанию все',
+        )
+
+    def handle(self, *args, **options):
+        if min(options['requests'], options['threads']) < 1:
+            raise CommandError('Параметры должны быть положительными')
+        settings_dict = connection.settings_dict
+        configured = settings_dict['CONN_MAX_AGE'] or 60
+        opened = []
+        connection_created.connect(
+            lambda **kwargs: opened.append(1), weak=False,
+            dispatch_uid='load_test'
+        )
+        try:
+            for mode in options['mode'] or MODES:
+                max_age = MODES[mode]
+                settings_dict['CONN_MAX_AGE'] = (
+                    configured if max_age is None else max_age
+                )
+                opened.clear()
+                started = time.perf_counter()
+                if mode == 'asgi':
+                    timings = asyncio.run(self.run_async(options))
+                else:
+                    timings = self.run(options)
+                elapsed = time.perf_counter() - started
+                self.report(mode, timings, len(opened), elapsed)
+        finally:
+            connection_created.disconnect(dispatch_uid='load_test')
+            settings_dict['CONN_MAX_AGE'] = configured
+
+    def run(self, options):
+        """Тестовый клиент не закрывает соединения сам, делаем как WSGI"""
+        per_thread = max(options['requests'] // options['threads'], 1)
+
+        def worker(_):
+            client = Client()
+            timings = []
+            try:
+                for _ in range(per_thread):
+                    started = time.perf_counter()
+                    close_old_connections()
+                    response = client.get(options['path'])
+                    close_old_connections()
+                    timings.append(time.perf_counter() - started)
+                    if response.status_code >= 500:
+                        raise CommandError(
+                            f'{options["path"]}: {response.status_code}'
+                        )
+            finally:
+                connections.close_all()
+            return timings
+
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            return sorted(
+                timing for timings in pool.map(
+                    worker, range(options['threads'])
+                ) for timing in timings
+            )
+
+    async def run_async(self, options):
+        per_client = max(options['requests'] // options['threads'], 1)
+
+        async def client_loop():
+            client = AsyncClient()
+            timings = []
+            for _ in range(per_client):
+                started = time.perf_counter()
+                response = await client.get(options['path'])
+                await sync_to_async(close_old_connections)()
+                timings.append(time.perf_counter() - started)
+                if response.status_code >= 500:
+                    raise CommandError(
+                        f'{options["path"]}: {response.status_code}'
+                    )
+            return timings
+
+        try:
+            results = await asyncio.gather(*(
+                client_loop() for _ in range(options['threads'])
+            ))
+        finally:
+            await sync_to_async(connections.close_all)()
+        return sorted(timing for timings in results for timing in timings)
+
+    def report(self, mode, timings, opened, elapsed):
+        self.stdout.write(
+            f'{mode}: запросов {len(timings)}, соединений {opened}, '
+            f'{len(timings) / elapsed:.0f} запросов/с, '
+            f'p50 {percentile(timings, 0.5) * 1000:.1f} мс, '
+            f'p99 {percentile(timings, 0.99) * 1000:.1f} мс, '
+            f'среднее {sum(timings) / len(timings) * 1000:.1f} мс'
+        )
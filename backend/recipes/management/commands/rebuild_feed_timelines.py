@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.feed import fill_timeline
+from recipes.models import TimelineEntry
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    """Пересборка готовых лент подписок"""
+    help = ('Пересобирает ленты пользователей с числом подписок не меньше '
+            'FEED_TIMELINE_THRESHOLD и удаляет ленты остальных')
+
+    def handle(self, *args, **options):
+        threshold = settings.FEED_TIMELINE_THRESHOLD
+        deleted, _ = TimelineEntry.objects.exclude(
+            user__subscriptions_count__gte=threshold
+        ).delete()
+        self.stdout.write(f'Удалено записей лент: {deleted}')
+        user_ids = User.objects.filter(
+            subscriptions_count__gte=threshold
+        ).values_list('id', flat=True)
+        rebuilt = 0
+        for user_id in user_ids.iterator():
+            with transaction.atomic():
+                TimelineEntry.objects.filter(user_id=user_id).delete()
+                fill_timeline(user_id)
+            rebuilt += 1
+        self.stdout.write(self.style.SUCCESS(f'Пересобрано лент: {rebuilt}'))
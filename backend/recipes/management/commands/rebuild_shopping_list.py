@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import ShoppingListItem
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    """Пересборка и проверка списков покупок по корзинам"""
+    help = 'Пересобирает таблицу списков покупок и сверяет её с корзинами'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify-only',
+            action='store_true',
+            help='Только сверить таблицу, ничего не меняя',
+        )
+
+    def handle(self, *args, **options):
+        if not options['verify_only']:
+            self.rebuild()
+        mismatches = self.verify()
+        if mismatches:
+            raise CommandError(f'Расхождений: {mismatches}')
+        self.stdout.write(self.style.SUCCESS('Списки покупок совпадают'))
+
+    @transaction.atomic
+    def rebuild(self):
+        ShoppingListItem.objects.all().delete()
+        batch = []
+        created = 0
+        for user_id, ingredient_id, total_amount in (
+                ShoppingListItem.objects.live_totals().iterator()):
+            batch.append(ShoppingListItem(
+                user_id=user_id,
+                ingredient_id=ingredient_id,
+                total_amount=total_amount,
+            ))
+            if len(batch) >= BATCH_SIZE:
+                created += len(ShoppingListItem.objects.bulk_create(batch))
+                batch = []
+        created += len(ShoppingListItem.objects.bulk_create(batch))
+        self.stdout.write(f'Записано позиций: {created}')
+
+    def verify(self):
+        expected = {
+            (user_id, ingredient_id): total_amount
+            for user_id, ingredient_id, total_amount
+            in ShoppingListItem.objects.live_totals().iterator()
+        }
+        mismatches = 0
+        for user_id, ingredient_id, total_amount in (
+                ShoppingListItem.objects.values_list(
+                    'user_id', 'ingredient_id', 'total_amount'
+                ).iterator()):
+            if expected.pop((user_id, ingredient_id), None) != total_amount:
+                mismatches += 1
+                self.stderr.write(
+                    f'user={user_id} ingredient={ingredient_id}: '
+                    f'{total_amount}'
+                )
+        for (user_id, ingredient_id), total_amount in expected.items():
+            mismatches += 1
+            self.stderr.write(
+                f'user={user_id} ingredient={ingredient_id}: '
+                f'нет записи, ожидается {total_amount}'
+            )
+        return mismatches
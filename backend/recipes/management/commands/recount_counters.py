@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from recipes.counters import COUNTERS, recount
+
+
+class Command(BaseCommand):
+    """Сверка и исправление денормализованных счётчиков"""
+    help = 'Пересчитывает счётчики избранного, корзин, рецептов и подписчиков'
+
+    def handle(self, *args, **options):
+        for model, field, counted, fk in COUNTERS:
+            drifted = recount(model, field, counted, fk)
+            self.stdout.write(
+                f'{model._meta.model_name}.{field}: исправлено {drifted}'
+            )
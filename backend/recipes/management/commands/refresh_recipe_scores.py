@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import Recipe
+from recipes.popularity import refresh_scores
+
+
+class Command(BaseCommand):
+    """Пересчёт популярности рецептов"""
+    help = ('Пересчитывает popularity и trending у рецептов, которые '
+            'добавляли или убирали из избранного и корзин после прошлого '
+            'запуска. Запускать периодически, например из cron')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Рецептов в одной транзакции',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересчитать все рецепты, например после смены периодов '
+                 'полураспада',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('Параметры должны быть положительными')
+        if options['all']:
+            Recipe.objects.update(score_dirty=True)
+        refreshed = refresh_scores(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано рецептов: {refreshed}'
+        ))
@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.similarity import rebuild_similar, refresh_similar, sparse
+
+
+class Command(BaseCommand):
+    """Пересчёт похожих рецептов"""
+    help = ('Пересчитывает списки похожих рецептов для новых и изменённых '
+            'рецептов. Запускать периодически, например из cron, '
+            'с --all — реже, чтобы учесть изменившиеся веса ингредиентов')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Рецептов в одной транзакции',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересчитать таблицу целиком',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('Параметры должны быть положительными')
+        limit = settings.SIMILAR_RECIPES_COUNT
+        if options['all']:
+            if sparse is None:
+                self.stdout.write('NumPy и SciPy не установлены, считаем '
+                                  'без них, это медленнее')
+            refreshed = rebuild_similar(limit)
+        else:
+            refreshed = refresh_similar(limit, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано рецептов: {refreshed}'
+        ))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from recipes.feed import trim_timelines
+
+
+class Command(BaseCommand):
+    """Обрезка готовых лент подписок"""
+    help = ('Удаляет из лент записи сверх FEED_TIMELINE_SIZE последних '
+            'рецептов. Запускать периодически, например из cron')
+
+    def handle(self, *args, **options):
+        deleted = trim_timelines()
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено записей лент: {deleted}'
+        ))
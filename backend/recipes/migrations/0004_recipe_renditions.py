@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_card',
+            field=models.ImageField(blank=True, editable=False, upload_to='recipes/renditions/', verbose_name='картинка для карточки'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='image_full',
+            field=models.ImageField(blank=True, editable=False, upload_to='recipes/renditions/', verbose_name='сжатая картинка'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='image_thumbnail',
+            field=models.ImageField(blank=True, editable=False, upload_to='recipes/renditions/', verbose_name='миниатюра'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations, models
+import recipes.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_recipe_renditions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(blank=True, storage=recipes.storage.ContentAddressedStorage(), upload_to='recipes/', verbose_name='картинка'),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='image_card',
+            field=models.ImageField(blank=True, editable=False, storage=recipes.storage.ContentAddressedStorage(), upload_to='recipes/renditions/', verbose_name='картинка для карточки'),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='image_full',
+            field=models.ImageField(blank=True, editable=False, storage=recipes.storage.ContentAddressedStorage(), upload_to='recipes/renditions/', verbose_name='сжатая картинка'),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='image_thumbnail',
+            field=models.ImageField(blank=True, editable=False, storage=recipes.storage.ContentAddressedStorage(), upload_to='recipes/renditions/', verbose_name='миниатюра'),
+        ),
+    ]
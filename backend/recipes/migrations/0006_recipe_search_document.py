@@ -0,0 +1,98 @@
+import django.contrib.postgres.search
+from django.db import migrations
+
+CREATE_SQL = """
+CREATE FUNCTION recipes_recipe_search_document() RETURNS trigger AS $$
+BEGIN
+    NEW.search_document :=
+        setweight(to_tsvector('russian', coalesce(NEW.name, '')), 'A') ||
+        setweight(to_tsvector('russian', coalesce((
+            SELECT string_agg(ingredient.name, ' ')
+            FROM recipes_ingredienttorecipe link
+            JOIN recipes_ingredient ingredient
+                ON ingredient.id = link.ingredient_id
+            WHERE link.recipe_id = NEW.id
+        ), '')), 'B') ||
+        setweight(to_tsvector('russian', coalesce(NEW.text, '')), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER recipes_recipe_search_document
+BEFORE INSERT OR UPDATE OF name, text ON recipes_recipe
+FOR EACH ROW EXECUTE FUNCTION recipes_recipe_search_document();
+
+CREATE FUNCTION recipes_ingredienttorecipe_search_document()
+RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE recipes_recipe SET name = name WHERE id = OLD.recipe_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE recipes_recipe SET name = name WHERE id = NEW.recipe_id;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER recipes_ingredienttorecipe_search_document
+AFTER INSERT OR UPDATE OR DELETE ON recipes_ingredienttorecipe
+FOR EACH ROW EXECUTE FUNCTION recipes_ingredienttorecipe_search_document();
+
+CREATE FUNCTION recipes_ingredient_search_document() RETURNS trigger AS $$
+BEGIN
+    UPDATE recipes_recipe SET name = name WHERE id IN (
+        SELECT recipe_id FROM recipes_ingredienttorecipe
+        WHERE ingredient_id = NEW.id
+    );
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER recipes_ingredient_search_document
+AFTER UPDATE OF name ON recipes_ingredient
+FOR EACH ROW EXECUTE FUNCTION recipes_ingredient_search_document();
+
+CREATE INDEX recipes_recipe_search_document_gin
+ON recipes_recipe USING gin (search_document);
+
+UPDATE recipes_recipe SET name = name;
+"""
+
+DROP_SQL = """
+DROP INDEX IF EXISTS recipes_recipe_search_document_gin;
+DROP TRIGGER IF EXISTS recipes_ingredient_search_document
+    ON recipes_ingredient;
+DROP FUNCTION IF EXISTS recipes_ingredient_search_document();
+DROP TRIGGER IF EXISTS recipes_ingredienttorecipe_search_document
+    ON recipes_ingredienttorecipe;
+DROP FUNCTION IF EXISTS recipes_ingredienttorecipe_search_document();
+DROP TRIGGER IF EXISTS recipes_recipe_search_document ON recipes_recipe;
+DROP FUNCTION IF EXISTS recipes_recipe_search_document();
+"""
+
+
+def create_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_SQL)
+
+
+def drop_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_content_addressed_images'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_document',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations, models
+
+
+def rename_duplicates(apps, schema_editor):
+    """Повторные названия у автора получают номер: «Суп (2)»"""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    max_length = Recipe._meta.get_field('name').max_length
+    duplicates = list(
+        Recipe.objects.values('author_id', 'name')
+        .annotate(count=models.Count('id')).filter(count__gt=1)
+    )
+    for group in duplicates:
+        recipes = Recipe.objects.filter(author_id=group['author_id'])
+        taken = set(recipes.values_list('name', flat=True))
+        number = 1
+        for pk in recipes.filter(name=group['name']).order_by(
+            'id'
+        ).values_list('id', flat=True)[1:]:
+            name = group['name']
+            while name in taken:
+                number += 1
+                suffix = f' ({number})'
+                name = group['name'][:max_length - len(suffix)] + suffix
+            taken.add(name)
+            Recipe.objects.filter(pk=pk).update(name=name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_reverse_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(rename_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='recipe',
+            constraint=models.UniqueConstraint(fields=('name', 'author'), name='unique_name_author'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_timelines(apps, schema_editor):
+    """То же, что fill_timeline, для всех, кто уже подписан на многих"""
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Recipe = apps.get_model('recipes', 'Recipe')
+    TimelineEntry = apps.get_model('recipes', 'TimelineEntry')
+    user_ids = User.objects.filter(
+        subscriptions_count__gte=settings.FEED_TIMELINE_THRESHOLD
+    ).values_list('id', flat=True)
+    for user_id in user_ids.iterator():
+        recipe_ids = Recipe.objects.filter(
+            author__following__user_id=user_id
+        ).order_by('-pub_date', '-id').values_list(
+            'id', flat=True
+        )[:settings.FEED_TIMELINE_SIZE]
+        TimelineEntry.objects.bulk_create(
+            (TimelineEntry(user_id=user_id, recipe_id=pk)
+             for pk in recipe_ids),
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0009_recipe_unique_name_author'),
+        ('users', '0012_customuser_subscriptions_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to='recipes.recipe', verbose_name='рецепт')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL, verbose_name='пользователь')),
+            ],
+            options={
+                'verbose_name': 'запись ленты',
+                'verbose_name_plural': 'ленты подписок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='timelineentry',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_timeline_entry'),
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
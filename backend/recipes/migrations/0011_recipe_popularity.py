@@ -0,0 +1,59 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def mark_active_recipes(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Recipe.objects.filter(
+        models.Q(favorites_count__gt=0) | models.Q(cart_count__gt=0)
+    ).update(score_dirty=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_timelineentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='favorite',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='добавлено'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='добавлено'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='popularity',
+            field=models.FloatField(default=0, editable=False, verbose_name='популярность'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='trending',
+            field=models.FloatField(default=0, editable=False, verbose_name='в тренде'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='score_dirty',
+            field=models.BooleanField(default=False, editable=False, verbose_name='нужно пересчитать популярность'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-popularity', '-id'], name='recipe_popularity_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-trending', '-id'], name='recipe_trending_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(condition=models.Q(('score_dirty', True)), fields=['id'], name='recipe_score_dirty_idx'),
+        ),
+        migrations.RunPython(mark_active_recipes, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,14 @@
-from django.db import models
+import time
+
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
+from django.db.models import Case, F, Sum, Value, When
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
 
 from foodgram.settings import MAX_LENGTH
+from users.models import DerivedFieldsMixin
+from .storage import recipe_storage
 
 User = get_user_model()
 
@@ -17,6 +23,7 @@ class Ingredient(models.Model):
     measurement_unit = models.CharField(
         'единицы измерения',
         max_length=MAX_LENGTH)
+    updated = models.DateTimeField('изменено', auto_now=True, db_index=True)
 
     class Meta:
         ordering = ['name']
@@ -44,6 +51,7 @@ class Tag(models.Model):
         max_length=MAX_LENGTH,
         unique=True
     )
+    updated = models.DateTimeField('изменено', auto_now=True, db_index=True)
 
     class Meta:
         ordering = ['-id']
@@ -54,7 +62,7 @@ class Tag(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class Recipe(DerivedFieldsMixin, models.Model):
     """Модель рецепта"""
     author = models.ForeignKey(
         User,
@@ -65,7 +73,29 @@ class Recipe(models.Model):
     image = models.ImageField(
         'картинка',
         upload_to='recipes/',
+        storage=recipe_storage,
+        blank=True,
+    )
+    image_thumbnail = models.ImageField(
+        'миниатюра',
+        upload_to='recipes/renditions/',
+        storage=recipe_storage,
         blank=True,
+        editable=False
+    )
+    image_card = models.ImageField(
+        'картинка для карточки',
+        upload_to='recipes/renditions/',
+        storage=recipe_storage,
+        blank=True,
+        editable=False
+    )
+    image_full = models.ImageField(
+        'сжатая картинка',
+        upload_to='recipes/renditions/',
+        storage=recipe_storage,
+        blank=True,
+        editable=False
     )
     text = models.TextField()
     ingredients = models.ManyToManyField(
@@ -81,6 +111,34 @@ class Recipe(models.Model):
         validators=[MinValueValidator(1, message='Минимальное значение 1')]
     )
     pub_date = models.DateTimeField(auto_now_add=True)
+    favorites_count = models.PositiveIntegerField(
+        'в избранном',
+        default=0,
+        editable=False
+    )
+    cart_count = models.PositiveIntegerField(
+        'в списках покупок',
+        default=0,
+        editable=False
+    )
+    search_document = SearchVectorField(null=True, editable=False)
+    popularity = models.FloatField('популярность', default=0, editable=False)
+    trending = models.FloatField('в тренде', default=0, editable=False)
+    score_dirty = models.BooleanField(
+        'нужно пересчитать популярность',
+        default=False,
+        editable=False
+    )
+    similar_dirty = models.BooleanField(
+        'нужно пересчитать похожие',
+        default=True,
+        editable=False
+    )
+
+    derived_fields = (
+        'favorites_count', 'cart_count', 'search_document', 'popularity',
+        'trending', 'score_dirty', 'similar_dirty',
+    )
 
     class Meta:
         verbose_name = 'рецепт'
@@ -90,11 +148,46 @@ class Recipe(models.Model):
             models.UniqueConstraint(fields=['name', 'author'],
                                     name='unique_name_author')
         ]
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='recipe_pub_date_id_idx'),
+            models.Index(fields=['-popularity', '-id'],
+                         name='recipe_popularity_id_idx'),
+            models.Index(fields=['-trending', '-id'],
+                         name='recipe_trending_id_idx'),
+            models.Index(fields=['id'], condition=models.Q(score_dirty=True),
+                         name='recipe_score_dirty_idx'),
+            models.Index(fields=['id'],
+                         condition=models.Q(similar_dirty=True),
+                         name='recipe_similar_dirty_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
 
+IMAGE_FIELDS = ('image', 'image_thumbnail', 'image_card', 'image_full')
+
+
+def delete_orphaned_images(grace):
+    """Удаляет файлы без рецептов, не использованные за grace секунд,
+    возвращает их число
+
+    Удаление отложено, чтобы не потерять картинку, которую загрузили
+    повторно, пока рецепт с ней ещё не сохранён: такая загрузка обновляет
+    время изменения файла.
+    """
+    referenced = set()
+    for names in Recipe.objects.values_list(*IMAGE_FIELDS).iterator():
+        referenced.update(names)
+    deadline = time.time() - grace
+    return sum(
+        recipe_storage.delete_stale(name, deadline)
+        for name in recipe_storage.walk('recipes')
+        if name not in referenced
+    )
+
+
 class IngredientToRecipe(models.Model):
     """Инридиенты для рецепта"""
     ingredient = models.ForeignKey(
@@ -138,6 +231,7 @@ class Favorite(models.Model):
         related_name='favorites',
         verbose_name='рецепт',
     )
+    created = models.DateTimeField('добавлено', auto_now_add=True)
 
     class Meta:
         ordering = ['-id']
@@ -147,6 +241,10 @@ class Favorite(models.Model):
             models.UniqueConstraint(fields=['user', 'recipe'],
                                     name='unique_favorite_recipe_for_user')
         ]
+        indexes = [
+            models.Index(fields=['recipe', 'user'],
+                         name='favorite_recipe_user_idx')
+        ]
 
 
 class Cart(models.Model):
@@ -163,6 +261,7 @@ class Cart(models.Model):
         related_name='cart',
         verbose_name='рецепт',
     )
+    created = models.DateTimeField('добавлено', auto_now_add=True)
 
     class Meta:
         ordering = ['-id']
@@ -172,3 +271,179 @@ class Cart(models.Model):
             models.UniqueConstraint(fields=['user', 'recipe'],
                                     name='unique_cart_user')
         ]
+        indexes = [
+            models.Index(fields=['recipe', 'user'],
+                         name='cart_recipe_user_idx')
+        ]
+
+
+class ShoppingListItemManager(models.Manager):
+    """Инкрементальное обновление списков покупок"""
+
+    def add_recipe(self, user_id, recipe_id):
+        """Рецепт добавлен в корзину пользователя"""
+        self.apply_deltas([user_id], self.recipe_amounts(recipe_id))
+
+    def remove_recipe(self, user_id, recipe_id):
+        """Рецепт убран из корзины пользователя"""
+        self.apply_deltas([user_id], {
+            ingredient_id: -amount
+            for ingredient_id, amount
+            in self.recipe_amounts(recipe_id).items()
+        })
+
+    def add_recipes(self, user, recipe_ids):
+        """Несколько рецептов добавлены в корзину пользователя"""
+        self.apply_deltas([user.id], self.recipes_amounts(recipe_ids))
+
+    def remove_recipes(self, user, recipe_ids):
+        """Несколько рецептов убраны из корзины пользователя"""
+        self.apply_deltas([user.id], {
+            ingredient_id: -amount
+            for ingredient_id, amount
+            in self.recipes_amounts(recipe_ids).items()
+        })
+
+    def change_recipe(self, recipe, deltas):
+        """Изменились ингредиенты рецепта, лежащего в корзинах"""
+        user_ids = list(recipe.cart.values_list('user_id', flat=True))
+        if user_ids:
+            self.apply_deltas(user_ids, deltas)
+
+    @staticmethod
+    def recipe_amounts(recipe_id):
+        return dict(
+            IngredientToRecipe.objects.filter(
+                recipe_id=recipe_id
+            ).values_list('ingredient_id', 'amount')
+        )
+
+    @staticmethod
+    def recipes_amounts(recipe_ids):
+        return dict(
+            IngredientToRecipe.objects.filter(
+                recipe_id__in=recipe_ids
+            ).order_by().values('ingredient_id').annotate(
+                total=Sum('amount')
+            ).values_list('ingredient_id', 'total')
+        )
+
+    def apply_deltas(self, user_ids, deltas):
+        """Прибавляет изменения количеств к спискам пользователей"""
+        deltas = {
+            ingredient_id: delta
+            for ingredient_id, delta in deltas.items() if delta
+        }
+        if not deltas:
+            return
+        with transaction.atomic():
+            self.bulk_create(
+                [
+                    self.model(
+                        user_id=user_id,
+                        ingredient_id=ingredient_id,
+                        total_amount=0
+                    )
+                    for user_id in user_ids
+                    for ingredient_id, delta in deltas.items() if delta > 0
+                ],
+                ignore_conflicts=True
+            )
+            items = self.filter(
+                user_id__in=user_ids, ingredient_id__in=deltas.keys()
+            )
+            items.update(total_amount=F('total_amount') + Case(
+                *(
+                    When(ingredient_id=ingredient_id, then=Value(delta))
+                    for ingredient_id, delta in deltas.items()
+                ),
+                output_field=models.IntegerField()
+            ))
+            items.filter(total_amount__lte=0).delete()
+
+    def live_totals(self):
+        """Агрегат списков покупок по корзинам"""
+        return IngredientToRecipe.objects.filter(
+            recipe__cart__isnull=False
+        ).values_list(
+            'recipe__cart__user_id', 'ingredient_id'
+        ).annotate(total_amount=Sum('amount')).order_by()
+
+
+class ShoppingListItem(models.Model):
+    """Сумма ингредиента в списке покупок пользователя"""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='ингредиент',
+    )
+    total_amount = models.IntegerField('количество')
+
+    objects = ShoppingListItemManager()
+
+    class Meta:
+        verbose_name = 'позиция списка покупок'
+        verbose_name_plural = 'список покупок'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'ingredient'],
+                                    name='unique_shopping_list_item')
+        ]
+
+
+class TimelineEntry(models.Model):
+    """Рецепт в заранее собранной ленте подписок пользователя"""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='пользователь',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='рецепт',
+    )
+
+    class Meta:
+        verbose_name = 'запись ленты'
+        verbose_name_plural = 'ленты подписок'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'recipe'],
+                                    name='unique_timeline_entry')
+        ]
+
+
+class SimilarRecipe(models.Model):
+    """Рецепт из заранее посчитанного списка похожих"""
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='neighbours',
+        verbose_name='рецепт',
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='neighbour_of',
+        verbose_name='похожий рецепт',
+    )
+    score = models.FloatField('сходство')
+
+    class Meta:
+        verbose_name = 'похожий рецепт'
+        verbose_name_plural = 'похожие рецепты'
+        constraints = [
+            models.UniqueConstraint(fields=['recipe', 'similar'],
+                                    name='unique_similar_recipe')
+        ]
+        indexes = [
+            models.Index(fields=['recipe', '-score'],
+                         name='similar_recipe_score_idx')
+        ]
@@ -0,0 +1,81 @@
+import math
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Cart, Favorite, Recipe
+
+# вес действия: корзина — намерение приготовить, весит больше избранного
+WEIGHTS = (
+    (Favorite, 1),
+    (Cart, 2),
+)
+
+EPOCH = datetime(2023, 1, 1, tzinfo=timezone.utc)
+
+DAY = 24 * 60 * 60
+
+
+def decayed_score(events, half_life):
+    """Затухающая оценка в логарифмической шкале относительно EPOCH
+
+    Вместо того чтобы уменьшать старые оценки, каждое действие весит
+    вдвое больше за каждый half_life после EPOCH: порядок рецептов тот же,
+    что у затухающих сумм на любой момент, поэтому рецепты без новых
+    действий пересчитывать не нужно. Хранится log2 суммы, чтобы число не
+    росло экспоненциально.
+    """
+    exponents = [
+        (created - EPOCH).total_seconds() / half_life + math.log2(weight)
+        for created, weight in events
+    ]
+    if not exponents:
+        return 0
+    top = max(exponents)
+    return top + math.log2(sum(2 ** (value - top) for value in exponents))
+
+
+def recipe_events(recipe_ids):
+    events = defaultdict(list)
+    for model, weight in WEIGHTS:
+        rows = model.objects.filter(recipe_id__in=recipe_ids).values_list(
+            'recipe_id', 'created'
+        )
+        for recipe_id, created in rows.iterator():
+            events[recipe_id].append((created, weight))
+    return events
+
+
+def refresh_scores(batch_size=500):
+    """Пересчитывает оценки рецептов с новыми действиями, возвращает их
+    число
+
+    Рецепты выбираются по score_dirty, который ставится вместе со
+    счётчиками избранного и корзины. Строки блокируются до записи, чтобы
+    отметка, поставленная во время пересчёта, не потерялась.
+    """
+    popular = settings.RECIPE_POPULAR_HALF_LIFE_DAYS * DAY
+    trending = settings.RECIPE_TRENDING_HALF_LIFE_DAYS * DAY
+    refreshed = 0
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            recipe_ids = list(Recipe.objects.select_for_update().filter(
+                score_dirty=True, id__gt=last_id
+            ).order_by('id').values_list('id', flat=True)[:batch_size])
+            if not recipe_ids:
+                return refreshed
+            events = recipe_events(recipe_ids)
+            Recipe.objects.bulk_update([
+                Recipe(
+                    id=recipe_id,
+                    popularity=decayed_score(events[recipe_id], popular),
+                    trending=decayed_score(events[recipe_id], trending),
+                    score_dirty=False,
+                )
+                for recipe_id in recipe_ids
+            ], ['popularity', 'trending', 'score_dirty'])
+        refreshed += len(recipe_ids)
+        last_id = recipe_ids[-1]
@@ -0,0 +1,191 @@
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from django.conf import settings
+
+from .models import Ingredient, IngredientToRecipe, Recipe
+
+FUZZY_THRESHOLD = 0.3
+RECIPE_FIELD_WEIGHTS = {'name': 3, 'ingredients': 2, 'text': 1}
+
+
+def normalize(value):
+    """Приводим строку к виду для поиска"""
+    return ' '.join(value.casefold().replace('ё', 'е').split())
+
+
+def words(value):
+    return re.findall(r'\w+', normalize(value))
+
+
+def trigrams(value):
+    """Триграммы строки с дополнением пробелами, как в pg_trgm"""
+    padded = f'  {value} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class LazyIndex:
+    """Индекс в памяти процесса, перестраиваемый после сброса или по TTL"""
+    ttl_setting = 'INGREDIENT_SEARCH_INDEX_TTL'
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.state = None
+        self.built_at = 0
+
+    def invalidate(self):
+        self.state = None
+
+    def get_state(self):
+        state = self.state
+        ttl = getattr(settings, self.ttl_setting)
+        if state is None or time.monotonic() - self.built_at > ttl:
+            with self.lock:
+                if self.state is state:
+                    self.state = self.build()
+                    self.built_at = time.monotonic()
+                state = self.state
+        return state
+
+
+class IngredientIndex(LazyIndex):
+    """Поисковый индекс ингредиентов в памяти процесса
+
+    Отсортированный список названий для поиска по префиксу и
+    триграммный индекс для подстрок и опечаток.
+    """
+
+    @staticmethod
+    def build():
+        entries = sorted(
+            (
+                (
+                    normalize(name),
+                    {'id': pk, 'name': name, 'measurement_unit': unit}
+                )
+                for pk, name, unit in Ingredient.objects.values_list(
+                    'id', 'name', 'measurement_unit'
+                ).order_by().iterator()
+            ),
+            key=lambda entry: (entry[0], entry[1]['id'])
+        )
+        keys = [key for key, _ in entries]
+        items = [item for _, item in entries]
+        sizes = []
+        postings = {}
+        for position, key in enumerate(keys):
+            grams = trigrams(key)
+            sizes.append(len(grams))
+            for gram in grams:
+                postings.setdefault(gram, []).append(position)
+        return keys, items, sizes, postings
+
+    @staticmethod
+    def prefix_matches(keys, query):
+        """Точные совпадения и совпадения по префиксу"""
+        start = bisect_left(keys, query)
+        end = start
+        while end < len(keys) and keys[end].startswith(query):
+            end += 1
+        yield from (p for p in range(start, end) if keys[p] == query)
+        yield from range(start, end)
+
+    @staticmethod
+    def substring_matches(keys, postings, query):
+        """Совпадения по подстроке среди кандидатов из триграмм"""
+        windows = {query[i:i + 3] for i in range(len(query) - 2)}
+        if not windows:
+            candidates = range(len(keys))
+        elif windows <= postings.keys():
+            candidates = sorted(set.intersection(
+                *(set(postings[gram]) for gram in windows)
+            ))
+        else:
+            candidates = ()
+        return (p for p in candidates if query in keys[p])
+
+    @staticmethod
+    def fuzzy_matches(sizes, postings, query):
+        """Похожие названия по доле общих триграмм"""
+        query_grams = trigrams(query)
+        shared = Counter()
+        for gram in query_grams:
+            shared.update(postings.get(gram, ()))
+        fuzzy = []
+        for position, common in shared.items():
+            similarity = common / (
+                len(query_grams) + sizes[position] - common
+            )
+            if similarity >= FUZZY_THRESHOLD:
+                fuzzy.append((-similarity, position))
+        return (position for _, position in sorted(fuzzy))
+
+    def search(self, query, limit):
+        """Поиск: точное совпадение, префикс, подстрока, опечатки"""
+        keys, items, sizes, postings = self.get_state()
+        query = normalize(query)
+        if not query:
+            return []
+        found = {}
+        for matches in (
+            lambda: self.prefix_matches(keys, query),
+            lambda: self.substring_matches(keys, postings, query),
+            lambda: self.fuzzy_matches(sizes, postings, query),
+        ):
+            for position in matches():
+                found.setdefault(position, None)
+                if len(found) >= limit:
+                    return [items[p] for p in found]
+        return [items[p] for p in found]
+
+
+class RecipeSearchIndex(LazyIndex):
+    """Обратный индекс рецептов для баз без полнотекстового поиска
+
+    Слова из названия, ингредиентов и описания с весами как у
+    setweight A, B и C в Postgres.
+    """
+    ttl_setting = 'RECIPE_SEARCH_INDEX_TTL'
+
+    @staticmethod
+    def build():
+        postings = defaultdict(Counter)
+        for pk, name, text in Recipe.objects.values_list(
+                'id', 'name', 'text').order_by().iterator():
+            for word in words(name):
+                postings[word][pk] += RECIPE_FIELD_WEIGHTS['name']
+            for word in words(text):
+                postings[word][pk] += RECIPE_FIELD_WEIGHTS['text']
+        for pk, name in IngredientToRecipe.objects.values_list(
+                'recipe_id', 'ingredient__name').order_by().iterator():
+            for word in words(name):
+                postings[word][pk] += RECIPE_FIELD_WEIGHTS['ingredients']
+        return dict(postings)
+
+    def search(self, query):
+        """Id рецептов со всеми словами запроса, по убыванию веса"""
+        postings = self.get_state()
+        scores = None
+        for word in set(words(query)):
+            found = postings.get(word, Counter())
+            if scores is None:
+                scores = Counter(found)
+            else:
+                scores = Counter({
+                    pk: score + found[pk]
+                    for pk, score in scores.items() if pk in found
+                })
+        if not scores:
+            return []
+        return [
+            pk for pk, _ in sorted(
+                scores.items(), key=lambda item: (-item[1], -item[0])
+            )
+        ]
+
+
+ingredient_index = IngredientIndex()
+recipe_search_index = RecipeSearchIndex()
@@ -0,0 +1,131 @@
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from users.models import Follow
+from .counters import counted_manually, update_counters
+from .feed import fan_out, follow_added, follow_removed
+from .images import RENDITIONS, schedule_renditions
+from .models import (
+    Cart,
+    Favorite,
+    Ingredient,
+    IngredientToRecipe,
+    Recipe,
+    ShoppingListItem,
+)
+from .search import ingredient_index, recipe_search_index
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredient_index(**kwargs):
+    """Перестроить поисковый индекс после изменения ингредиентов"""
+    ingredient_index.invalidate()
+    recipe_search_index.invalidate()
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=IngredientToRecipe)
+def invalidate_recipe_search_index(**kwargs):
+    """Перестроить индекс поиска рецептов после их изменения"""
+    recipe_search_index.invalidate()
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def mark_similar_dirty(instance, action, reverse, **kwargs):
+    """Тэги рецепта изменились — похожие нужно пересчитать
+
+    Флаг в экземпляре мог устареть: refresh_similar_recipes сбрасывает
+    его в базе, поэтому UPDATE выполняется всегда.
+    """
+    if reverse:
+        return
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        Recipe.objects.filter(pk=instance.pk).update(similar_dirty=True)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=Cart)
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Follow)
+def increment_counters(sender, instance, created, **kwargs):
+    """Увеличить счётчики после добавления строки"""
+    if created and not counted_manually.get():
+        update_counters(sender, instance, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=Cart)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Follow)
+def decrement_counters(sender, instance, **kwargs):
+    """Уменьшить счётчики после удаления строки"""
+    if not counted_manually.get():
+        update_counters(sender, instance, -1)
+
+
+@receiver(post_save, sender=Cart)
+def add_to_shopping_list(instance, created, **kwargs):
+    """Ингредиенты рецепта из корзины попадают в список покупок"""
+    if created and not counted_manually.get():
+        ShoppingListItem.objects.add_recipe(
+            instance.user_id, instance.recipe_id
+        )
+
+
+@receiver(pre_delete, sender=Cart)
+def remove_from_shopping_list(instance, **kwargs):
+    """До удаления: при удалении рецепта его ингредиенты ещё на месте"""
+    if not counted_manually.get():
+        ShoppingListItem.objects.remove_recipe(
+            instance.user_id, instance.recipe_id
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def add_to_timelines(instance, created, **kwargs):
+    """Разослать новый рецепт по готовым лентам подписчиков"""
+    if created:
+        fan_out(instance)
+
+
+@receiver(post_save, sender=Follow)
+def add_author_to_timeline(instance, created, **kwargs):
+    if created:
+        follow_added(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def remove_author_from_timeline(instance, **kwargs):
+    follow_removed(instance)
+
+
+@receiver(pre_save, sender=Recipe)
+def reset_renditions(instance, update_fields, **kwargs):
+    """Копии заменённой картинки больше не нужны"""
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    previous = ''
+    if instance.pk is not None:
+        previous = Recipe.objects.filter(pk=instance.pk).values_list(
+            'image', flat=True
+        ).first() or ''
+    image = instance.image
+    instance.image_changed = not image._committed or image.name != previous
+    if instance.image_changed:
+        for field in RENDITIONS:
+            setattr(instance, field, '')
+
+
+@receiver(post_save, sender=Recipe)
+def build_new_renditions(instance, **kwargs):
+    """Новая картинка из API или админки — строим копии заново"""
+    if getattr(instance, 'image_changed', False):
+        instance.image_changed = False
+        if instance.image:
+            schedule_renditions(instance.id)
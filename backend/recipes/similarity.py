@@ -0,0 +1,245 @@
+import heapq
+import math
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, Min
+
+from .models import IngredientToRecipe, Recipe, SimilarRecipe
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    np = sparse = None
+
+# признаки рецепта: ингредиенты и тэги
+FEATURES = (
+    (IngredientToRecipe, 'ingredient_id'),
+    (Recipe.tags.through, 'tag_id'),
+)
+
+BATCH_SIZE = 256
+
+# знаков сходства, при совпадении которых рецепты считаются равными
+PRECISION = 12
+
+
+def top(scores, limit):
+    """Самые похожие, при равенстве — с меньшим id"""
+    return heapq.nlargest(
+        limit, scores.items(),
+        key=lambda item: (round(item[1], PRECISION), -item[0])
+    )
+
+
+class RecipeVectors:
+    """Разреженные векторы рецептов с весами IDF
+
+    Признак — ингредиент или тэг рецепта, его вес
+    log((1 + N) / (1 + df)) + 1, сходство — косинус. С NumPy и SciPy
+    сходства считаются умножением разреженных матриц пачками строк,
+    без них — по инвертированному индексу.
+    """
+
+    def __init__(self):
+        self.features = defaultdict(set)
+        frequency = Counter()
+        for source, (model, field) in enumerate(FEATURES):
+            rows = model.objects.values_list('recipe_id', field)
+            for recipe_id, value in rows.iterator():
+                self.features[recipe_id].add((source, value))
+                frequency[source, value] += 1
+        total = Recipe.objects.count()
+        self.weights = {
+            feature: math.log((1 + total) / (1 + count)) + 1
+            for feature, count in frequency.items()
+        }
+        self.norms = {
+            recipe_id: math.sqrt(sum(
+                self.weights[feature] ** 2 for feature in features
+            ))
+            for recipe_id, features in self.features.items()
+        }
+
+    def scores(self, recipe_ids, limit=None):
+        """Пары (id, {id похожего: сходство}), с limit — только лучшие"""
+        for recipe_id in recipe_ids:
+            if recipe_id not in self.features:
+                yield recipe_id, {}
+        recipe_ids = [pk for pk in recipe_ids if pk in self.features]
+        if sparse is None:
+            yield from self.python_scores(recipe_ids, limit)
+        else:
+            yield from self.sparse_scores(recipe_ids, limit)
+
+    def python_scores(self, recipe_ids, limit):
+        postings = defaultdict(list)
+        for recipe_id, features in self.features.items():
+            for feature in features:
+                postings[feature].append(recipe_id)
+        for recipe_id in recipe_ids:
+            dots = Counter()
+            for feature in self.features[recipe_id]:
+                weight = self.weights[feature] ** 2
+                for other in postings[feature]:
+                    dots[other] += weight
+            dots.pop(recipe_id, None)
+            norm = self.norms[recipe_id]
+            scores = {
+                other: dot / (norm * self.norms[other])
+                for other, dot in dots.items()
+            }
+            yield recipe_id, dict(top(scores, limit)) if limit else scores
+
+    def sparse_scores(self, recipe_ids, limit):
+        ids = list(self.features)
+        rows = {recipe_id: row for row, recipe_id in enumerate(ids)}
+        matrix = self.matrix(ids)
+        transposed = matrix.T.tocsr()
+        for start in range(0, len(recipe_ids), BATCH_SIZE):
+            batch = recipe_ids[start:start + BATCH_SIZE]
+            block = matrix[[rows[pk] for pk in batch]] @ transposed
+            block = block.tocsr()
+            for offset, recipe_id in enumerate(batch):
+                segment = slice(block.indptr[offset], block.indptr[offset + 1])
+                columns = block.indices[segment]
+                values = block.data[segment]
+                if limit and len(values) > limit + 1:
+                    bound = np.partition(values, -limit - 1)[-limit - 1]
+                    keep = values >= bound - 10 ** -PRECISION
+                    columns, values = columns[keep], values[keep]
+                scores = {
+                    ids[column]: float(value)
+                    for column, value in zip(columns, values)
+                }
+                scores.pop(recipe_id, None)
+                yield recipe_id, dict(top(scores, limit)) if limit else scores
+
+    def matrix(self, ids):
+        """Строки — рецепты ids, нормированные до единичной длины"""
+        columns = {
+            feature: index for index, feature in enumerate(self.weights)
+        }
+        rows, cols, data = [], [], []
+        for row, recipe_id in enumerate(ids):
+            norm = self.norms[recipe_id]
+            for feature in self.features[recipe_id]:
+                rows.append(row)
+                cols.append(columns[feature])
+                data.append(self.weights[feature] / norm)
+        return sparse.csr_matrix(
+            (data, (rows, cols)), shape=(len(ids), len(columns))
+        )
+
+
+def rebuild_similar(limit):
+    """Полный пересчёт таблицы похожих, возвращает число рецептов"""
+    with transaction.atomic():
+        Recipe.objects.filter(similar_dirty=True).update(similar_dirty=False)
+        vectors = RecipeVectors()
+        SimilarRecipe.objects.all().delete()
+        SimilarRecipe.objects.bulk_create(
+            (
+                SimilarRecipe(recipe_id=recipe_id, similar_id=other,
+                              score=score)
+                for recipe_id, scores in vectors.scores(
+                    list(vectors.features), limit
+                )
+                for other, score in scores.items()
+            ),
+            batch_size=5000,
+        )
+    return len(vectors.features)
+
+
+def refresh_similar(limit, batch_size=500):
+    """Пересчитывает похожие для изменённых рецептов, возвращает их число
+
+    Рецепт получает новый список похожих и попадает в списки тех, у кого
+    он теперь ближе последнего соседа; списки, из которых он выбыл,
+    пересчитываются целиком, в том числе у изменённых рецептов из той же
+    пачки. Сходство остальных пар при этом не меняется,
+    сдвиг IDF поправляет полный пересчёт.
+    """
+    refreshed = 0
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            recipe_ids = list(Recipe.objects.select_for_update().filter(
+                similar_dirty=True, id__gt=last_id
+            ).order_by('id').values_list('id', flat=True)[:batch_size])
+            if not recipe_ids:
+                return refreshed
+            Recipe.objects.filter(id__in=recipe_ids).update(
+                similar_dirty=False
+            )
+            vectors = RecipeVectors()
+            lists = NeighbourLists(limit)
+            holders = set()
+            for recipe_id, scores in vectors.scores(recipe_ids):
+                holders |= lists.replace(recipe_id, scores)
+            for recipe_id, scores in vectors.scores(sorted(holders), limit):
+                lists.reset(recipe_id, scores)
+        refreshed += len(recipe_ids)
+        last_id = recipe_ids[-1]
+
+
+class NeighbourLists:
+    """Списки похожих в базе: сколько в каждом и худшее сходство"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.bounds = {
+            recipe_id: (count, worst)
+            for recipe_id, count, worst in SimilarRecipe.objects.order_by(
+            ).values('recipe_id').annotate(
+                count=Count('id'), worst=Min('score')
+            ).values_list('recipe_id', 'count', 'worst')
+        }
+
+    def accepts(self, recipe_id, score):
+        count, worst = self.bounds.get(recipe_id, (0, 0))
+        return count < self.limit or score > worst
+
+    def reset(self, recipe_id, scores):
+        """Собственный список рецепта"""
+        SimilarRecipe.objects.filter(recipe_id=recipe_id).delete()
+        own = top(scores, self.limit)
+        SimilarRecipe.objects.bulk_create(
+            SimilarRecipe(recipe_id=recipe_id, similar_id=other, score=score)
+            for other, score in own
+        )
+        self.bounds[recipe_id] = (len(own), own[-1][1] if own else 0)
+
+    def replace(self, recipe_id, scores):
+        """Новые соседи рецепта и его место в чужих списках, возвращает
+        рецепты, из списков которых он выбыл"""
+        holders = set(SimilarRecipe.objects.filter(
+            similar_id=recipe_id
+        ).values_list('recipe_id', flat=True))
+        SimilarRecipe.objects.filter(similar_id=recipe_id).delete()
+        self.reset(recipe_id, scores)
+        joined = {
+            other: score for other, score in scores.items()
+            if other not in holders and self.accepts(other, score)
+        }
+        SimilarRecipe.objects.bulk_create(
+            SimilarRecipe(recipe_id=other, similar_id=recipe_id, score=score)
+            for other, score in joined.items()
+        )
+        self.trim(joined)
+        return holders
+
+    def trim(self, changed):
+        """Переполненные списки теряют самого далёкого соседа"""
+        rows = defaultdict(list)
+        for row in SimilarRecipe.objects.filter(recipe_id__in=changed):
+            rows[row.recipe_id].append(row)
+        evicted = []
+        for recipe_id, neighbours in rows.items():
+            neighbours.sort(key=lambda row: (-row.score, row.similar_id))
+            evicted += [row.id for row in neighbours[self.limit:]]
+            kept = neighbours[:self.limit]
+            self.bounds[recipe_id] = (len(kept), kept[-1].score)
+        SimilarRecipe.objects.filter(id__in=evicted).delete()
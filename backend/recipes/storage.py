@@ -0,0 +1,68 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+TRASH_SUFFIX = '.deleting'
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Файлы называются по SHA-256 содержимого
+
+    Одинаковые картинки хранятся один раз, а имя файла никогда не
+    указывает на другое содержимое, поэтому их можно кэшировать навсегда.
+    Время изменения файла — время последнего использования: загрузка уже
+    существующей картинки его обновляет, и delete_stale такой файл не
+    удалит.
+    """
+
+    def save(self, name, content, max_length=None):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        directory, filename = posixpath.split(name.replace('\\', '/'))
+        extension = posixpath.splitext(filename)[1].lower()
+        digest = digest.hexdigest()
+        name = posixpath.join(directory, digest[:2], digest + extension)
+        try:
+            os.utime(self.path(name))
+            return name
+        except FileNotFoundError:
+            return super().save(name, content, max_length)
+
+    def walk(self, directory):
+        """Имена всех файлов каталога и его подкаталогов"""
+        if not self.exists(directory):
+            return
+        directories, files = self.listdir(directory)
+        for filename in files:
+            yield posixpath.join(directory, filename)
+        for subdirectory in directories:
+            yield from self.walk(posixpath.join(directory, subdirectory))
+
+    def delete_stale(self, name, deadline):
+        """Удаляет файл, не использованный после deadline
+
+        Файл сначала переименовывается: одновременная загрузка такой же
+        картинки либо не найдёт его и запишет заново, либо успеет
+        обновить время изменения, и тогда файл вернётся на место.
+        """
+        path = self.path(name)
+        trash = path + TRASH_SUFFIX
+        try:
+            if os.path.getmtime(path) > deadline:
+                return False
+            os.rename(path, trash)
+        except FileNotFoundError:
+            return False
+        if os.path.getmtime(trash) > deadline:
+            os.rename(trash, path)
+            return False
+        os.remove(trash)
+        return True
+
+
+recipe_storage = ContentAddressedStorage()
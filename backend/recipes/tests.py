@@ -0,0 +1,420 @@
+import os
+import shutil
+import tempfile
+import time
+from importlib import import_module
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock, skipIf, skipUnless
+
+from django.apps import apps
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from users.models import Follow
+from .benchmark import seed_dataset
+from .management.commands.explain_queries import hot_queries, is_full_scan
+from .models import (
+    Favorite,
+    Ingredient,
+    IngredientToRecipe,
+    Recipe,
+    SimilarRecipe,
+    Tag,
+    TimelineEntry,
+    delete_orphaned_images,
+)
+from .similarity import (
+    RecipeVectors,
+    rebuild_similar,
+    refresh_similar,
+    sparse,
+)
+from .storage import recipe_storage
+
+User = get_user_model()
+
+
+TEST_DATA = Path(__file__).resolve().parent / 'test_data'
+
+
+def make_user(name):
+    return User.objects.create(
+        username=name, email=f'{name}@example.com',
+        first_name=name, last_name=name, password=name
+    )
+
+
+def make_image(color):
+    buffer = BytesIO()
+    Image.new('RGB', (800, 600), color).save(buffer, 'PNG')
+    return ContentFile(buffer.getvalue(), name='image.png')
+
+
+class DerivedFieldsTest(TestCase):
+    """save() не затирает счётчики, изменённые после чтения объекта"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = make_user('author')
+        cls.reader = make_user('reader')
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='рецепт', text='Описание',
+            cooking_time=10, image='recipes/test.png'
+        )
+
+    def test_recipe(self):
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        Favorite.objects.create(user=self.reader, recipe=self.recipe)
+        recipe.name = 'новое название'
+        recipe.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, 'новое название')
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assertTrue(recipe.score_dirty)
+
+    def test_scores(self):
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        Recipe.objects.filter(pk=self.recipe.pk).update(
+            popularity=5, trending=3
+        )
+        recipe.save()
+        recipe.refresh_from_db()
+        self.assertEqual((recipe.popularity, recipe.trending), (5, 3))
+
+    def test_user(self):
+        author = User.objects.get(pk=self.author.pk)
+        Follow.objects.create(user=self.reader, author=self.author)
+        author.first_name = 'автор'
+        author.save()
+        author.refresh_from_db()
+        self.assertEqual(author.first_name, 'автор')
+        self.assertEqual(author.followers_count, 1)
+        self.assertEqual(author.recipes_count, 1)
+
+
+class MediaTestCase(TestCase):
+    """Файлы пишутся во временный MEDIA_ROOT"""
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        settings = override_settings(MEDIA_ROOT=media, IMAGE_WORKERS=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+
+class RenditionsTest(MediaTestCase):
+    """Копии строятся заново при смене картинки из любого места"""
+
+    def test_admin_save(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe.objects.create(
+                author=make_user('author'), name='рецепт', text='Описание',
+                cooking_time=10, image=make_image('red')
+            )
+        recipe.refresh_from_db()
+        old = recipe.image_thumbnail.name
+        self.assertTrue(old)
+        # так сохраняет форма админки: полный save() с новым файлом
+        recipe.image = make_image('blue')
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.save()
+            self.assertFalse(recipe.image_thumbnail)
+        recipe.refresh_from_db()
+        self.assertTrue(recipe.image_thumbnail)
+        self.assertNotEqual(recipe.image_thumbnail.name, old)
+
+    def test_unchanged_image(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe.objects.create(
+                author=make_user('author'), name='рецепт', text='Описание',
+                cooking_time=10, image=make_image('red')
+            )
+        recipe.refresh_from_db()
+        thumbnail = recipe.image_thumbnail.name
+        recipe.name = 'другое название'
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.image_thumbnail.name, thumbnail)
+
+
+class OrphanedImagesTest(MediaTestCase):
+    """Файлы без рецептов удаляются, только если их давно не
+    использовали"""
+    GRACE = 60 * 60
+
+    def save_old(self, color):
+        name = recipe_storage.save('recipes/image.png', make_image(color))
+        past = time.time() - 2 * self.GRACE
+        os.utime(recipe_storage.path(name), (past, past))
+        return name
+
+    def test_orphan_is_deleted(self):
+        orphan = self.save_old('red')
+        used = self.save_old('blue')
+        Recipe.objects.create(
+            author=make_user('author'), name='рецепт', text='Описание',
+            cooking_time=10, image=used
+        )
+        self.assertEqual(delete_orphaned_images(self.GRACE), 1)
+        self.assertFalse(recipe_storage.exists(orphan))
+        self.assertTrue(recipe_storage.exists(used))
+
+    def test_reused_file_is_kept(self):
+        name = self.save_old('red')
+        # та же картинка загружена снова, рецепт ещё не сохранён
+        self.assertEqual(
+            recipe_storage.save('recipes/copy.png', make_image('red')), name
+        )
+        self.assertEqual(delete_orphaned_images(self.GRACE), 0)
+        self.assertTrue(recipe_storage.exists(name))
+
+
+class HotQueriesPlanTest(TestCase):
+    """Частые запросы идут по индексам на заполненной базе"""
+
+    @classmethod
+    def setUpTestData(cls):
+        data = seed_dataset(200, 2000)
+        cls.user, cls.recipe = data.users[-1], data.recipes[-1]
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def test_no_full_scans(self):
+        queries = hot_queries(self.user, self.recipe)
+        for name, (model, queryset) in queries.items():
+            with self.subTest(name):
+                plan = queryset.explain()
+                self.assertFalse(is_full_scan(model, plan), plan)
+
+
+@skipUnless(connection.vendor == 'postgresql',
+            'benchmarks/api.json записан на Postgres')
+class BenchmarkBaselineTest(TestCase):
+    """Число запросов и размер ответов API не выросли против baseline"""
+
+    def test_no_regressions(self):
+        call_command('benchmark_api', '--repeat', '1', stdout=StringIO())
+
+
+@override_settings(FEED_TIMELINE_THRESHOLD=1, FEED_TIMELINE_SIZE=2)
+class TimelineTest(TestCase):
+    """Готовая лента хранит только FEED_TIMELINE_SIZE последних рецептов"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = make_user('reader')
+        cls.authors = [make_user('author'), make_user('writer')]
+
+    def publish(self, author, count):
+        return [
+            Recipe.objects.create(
+                author=author, name=f'{author.username} {number}',
+                text='Описание', cooking_time=10, image='recipes/test.png'
+            ).id
+            for number in range(count)
+        ]
+
+    def timeline(self):
+        return list(TimelineEntry.objects.filter(user=self.reader).order_by(
+            '-recipe__pub_date', '-recipe_id'
+        ).values_list('recipe_id', flat=True))
+
+    def test_fan_out(self):
+        Follow.objects.create(user=self.reader, author=self.authors[0])
+        recipes = self.publish(self.authors[0], 3)
+        # создание рецепта не читает ленты, их обрезает команда
+        self.assertEqual(self.timeline(), recipes[::-1])
+        out = StringIO()
+        call_command('trim_feed_timelines', stdout=out)
+        self.assertIn('1', out.getvalue())
+        self.assertEqual(self.timeline(), recipes[:0:-1])
+
+    def test_follow_another_author(self):
+        Follow.objects.create(user=self.reader, author=self.authors[0])
+        self.publish(self.authors[0], 2)
+        recipes = self.publish(self.authors[1], 3)
+        Follow.objects.create(user=self.reader, author=self.authors[1])
+        self.assertEqual(self.timeline(), recipes[:0:-1])
+
+    def test_migration_backfill(self):
+        recipes = self.publish(self.authors[0], 3)
+        # подписки появились до таблицы лент
+        Follow.objects.bulk_create([
+            Follow(user=self.reader, author=self.authors[0])
+        ])
+        User.objects.filter(pk=self.reader.pk).update(subscriptions_count=1)
+        migration = import_module('recipes.migrations.0010_timelineentry')
+        migration.fill_timelines(apps, None)
+        self.assertEqual(self.timeline(), recipes[:0:-1])
+
+
+class SimilarRecipesTest(TestCase):
+    """Пересчёт изменённых рецептов даёт ту же таблицу, что и полный"""
+    LIMIT = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        author = make_user('author')
+        cls.tags = [
+            Tag.objects.create(name=f'тэг {number}', slug=f'tag-{number}',
+                               color=f'#00000{number}')
+            for number in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(name=f'ингредиент {number}',
+                                      measurement_unit='г')
+            for number in range(8)
+        ]
+        cls.recipes = []
+        for number in range(10):
+            recipe = Recipe.objects.create(
+                author=author, name=f'рецепт {number}', text='Описание',
+                cooking_time=10, image='recipes/test.png'
+            )
+            recipe.tags.set([cls.tags[number % 3]])
+            IngredientToRecipe.objects.bulk_create(
+                IngredientToRecipe(recipe=recipe, ingredient=ingredient,
+                                   amount=100)
+                for ingredient in ingredients[number % 5:number % 5 + 3]
+            )
+            cls.recipes.append(recipe)
+
+    def table(self):
+        return sorted(
+            (recipe_id, similar_id, round(score, 9))
+            for recipe_id, similar_id, score
+            in SimilarRecipe.objects.values_list(
+                'recipe_id', 'similar_id', 'score'
+            )
+        )
+
+    def assertRefreshMatchesRebuild(self):
+        refresh_similar(self.LIMIT)
+        refreshed = self.table()
+        rebuild_similar(self.LIMIT)
+        self.assertEqual(refreshed, self.table())
+
+    def test_dirty_neighbours(self):
+        rebuild_similar(self.LIMIT)
+        # обмен тэгами не меняет веса признаков, только соседей
+        for first, second in ((0, 1), (3, 5)):
+            first, second = self.recipes[first], self.recipes[second]
+            first_tags = list(first.tags.all())
+            first.tags.set(second.tags.all())
+            second.tags.set(first_tags)
+        self.assertEqual(
+            Recipe.objects.filter(similar_dirty=True).count(), 4
+        )
+        self.assertRefreshMatchesRebuild()
+
+    def test_all_dirty(self):
+        rebuild_similar(self.LIMIT)
+        IngredientToRecipe.objects.filter(recipe__in=self.recipes[:4]).delete()
+        Recipe.objects.update(similar_dirty=True)
+        self.assertRefreshMatchesRebuild()
+
+    def test_stale_flag(self):
+        recipe = Recipe.objects.get(pk=self.recipes[0].pk)
+        stale = Recipe.objects.get(pk=self.recipes[0].pk)
+        recipe.tags.set([self.tags[1]])
+        refresh_similar(self.LIMIT)
+        # флаг уже сброшен в базе, но не в экземпляре
+        recipe.tags.set([self.tags[2]])
+        stale.save()
+        self.assertTrue(Recipe.objects.get(pk=recipe.pk).similar_dirty)
+
+
+@skipIf(sparse is None, 'NumPy и SciPy не установлены')
+class SparseScoresTest(TestCase):
+    """Матричный и чистый Python счёт дают одну таблицу похожих"""
+    LIMIT = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        # больше рецептов, чем в одной пачке матрицы, и много равных сходств
+        seed_dataset(20, 600)
+
+    def table(self):
+        return sorted(
+            (recipe_id, similar_id, round(score, 9))
+            for recipe_id, similar_id, score
+            in SimilarRecipe.objects.values_list(
+                'recipe_id', 'similar_id', 'score'
+            )
+        )
+
+    def test_scores(self):
+        vectors = RecipeVectors()
+        ids = list(vectors.features)
+        for limit in (self.LIMIT, None):
+            with self.subTest(limit=limit):
+                python = dict(vectors.python_scores(ids, limit))
+                matrix = dict(vectors.sparse_scores(ids, limit))
+                self.assertEqual(python.keys(), matrix.keys())
+                for recipe_id, scores in python.items():
+                    self.assertEqual(scores.keys(), matrix[recipe_id].keys())
+                    for other, score in scores.items():
+                        self.assertAlmostEqual(
+                            score, matrix[recipe_id][other], places=9
+                        )
+
+    def test_rebuild(self):
+        rebuild_similar(self.LIMIT)
+        matrix = self.table()
+        with mock.patch('recipes.similarity.sparse', None):
+            rebuild_similar(self.LIMIT)
+        self.assertEqual(matrix, self.table())
+
+
+class LoadIngredientsTest(TestCase):
+    """Загрузка справочника ингредиентов из csv и json"""
+    command = 'recipes.management.commands.load_ingredients'
+    expected = {('мука', 'г'), ('молоко', 'мл'), ('соль', 'г')}
+
+    def load(self, name, *args):
+        output = StringIO()
+        call_command(
+            'load_ingredients', str(TEST_DATA / name), *args, stdout=output
+        )
+        return output.getvalue()
+
+    def loaded(self):
+        return set(
+            Ingredient.objects.values_list('name', 'measurement_unit')
+        )
+
+    def test_csv(self):
+        # заголовок пропускается, пустое название — битая строка, повтор
+        # в файле сохраняется один раз
+        self.assertIn('Загружено: 3, пропущено: 1', self.load(
+            'ingredients.csv'
+        ))
+        self.assertEqual(self.loaded(), self.expected)
+        self.load('ingredients.csv')
+        self.assertEqual(Ingredient.objects.count(), 3)
+
+    def test_json(self):
+        # маленький буфер: объекты разрезаны между чтениями файла
+        with mock.patch(f'{self.command}.READ_CHUNK_SIZE', 8):
+            output = self.load('ingredients.json', '--batch-size', '2')
+        self.assertIn('Загружено: 3, пропущено: 1', output)
+        self.assertEqual(self.loaded(), self.expected)
+
+    def test_dry_run(self):
+        with mock.patch(f'{self.command}.bump_catalogue_version') as bump:
+            for name in ('ingredients.csv', 'ingredients.json'):
+                with self.subTest(name):
+                    self.assertIn(
+                        'Проверено: 3, пропущено: 1',
+                        self.load(name, '--dry-run')
+                    )
+        self.assertFalse(Ingredient.objects.exists())
+        bump.assert_not_called()
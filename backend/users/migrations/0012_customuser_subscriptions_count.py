@@ -0,0 +1,32 @@
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_subscriptions_count(apps, schema_editor):
+    CustomUser = apps.get_model('users', 'CustomUser')
+    Follow = apps.get_model('users', 'Follow')
+    CustomUser.objects.update(subscriptions_count=Coalesce(
+        Subquery(
+            Follow.objects.filter(user=OuterRef('pk')).order_by().values(
+                'user'
+            ).annotate(total=Count('pk')).values('total')
+        ),
+        Value(0)
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0011_follow_author_user_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='subscriptions_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='подписок'),
+        ),
+        migrations.RunPython(fill_subscriptions_count, migrations.RunPython.noop),
+    ]
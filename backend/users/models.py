@@ -4,7 +4,25 @@ from django.db import models
 from foodgram.settings import MAX_LENGTH
 
 
-class CustomUser(AbstractUser):
+class DerivedFieldsMixin:
+    """save() без update_fields не перезаписывает поля derived_fields
+
+    Эти поля меняются только отдельными UPDATE — счётчики, оценки,
+    отметки пересчёта, — а в экземпляре лежат значения на момент чтения.
+    """
+    derived_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.derived_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+class CustomUser(DerivedFieldsMixin, AbstractUser):
     """Кастомный юзер для фудграма"""
     email = models.EmailField(
         unique=True,
@@ -31,6 +49,25 @@ class CustomUser(AbstractUser):
         verbose_name='фамилия',
         max_length=MAX_LENGTH
     )
+    recipes_count = models.PositiveIntegerField(
+        'рецептов',
+        default=0,
+        editable=False
+    )
+    followers_count = models.PositiveIntegerField(
+        'подписчиков',
+        default=0,
+        editable=False
+    )
+    subscriptions_count = models.PositiveIntegerField(
+        'подписок',
+        default=0,
+        editable=False
+    )
+
+    derived_fields = (
+        'recipes_count', 'followers_count', 'subscriptions_count'
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
@@ -68,6 +105,10 @@ class Follow(models.Model):
                 name='unique_follow',
             )
         ]
+        indexes = [
+            models.Index(fields=['author', 'user'],
+                         name='follow_author_user_idx')
+        ]
 
     def __str__(self):
         return f'{self.user.username} -> {self.author.username}'
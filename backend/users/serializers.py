@@ -2,12 +2,13 @@ from django.contrib.auth import get_user_model
 from djoser.serializers import UserSerializer
 from rest_framework.serializers import SerializerMethodField
 
+from api.metrics import TimedSerializerMixin
 from .models import Follow
 
 User = get_user_model()
 
 
-class CustomUserSerializer(UserSerializer):
+class CustomUserSerializer(TimedSerializerMixin, UserSerializer):
     """Сериалайзер для кастомного юзера"""
     is_subscribed = SerializerMethodField(read_only=True)
 
@@ -26,6 +27,8 @@ class CustomUserSerializer(UserSerializer):
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         return Follow.objects.filter(user=user, author=obj).exists()
 
     def create(self, validated_data):
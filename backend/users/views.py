@@ -1,14 +1,19 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import BooleanField, Prefetch, Value
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework import status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
 from api.paginators import LimitPagePagination
 from .models import Follow
 from api.serializers import FollowSerializer, CustomUserSerializer
+from recipes.models import Recipe
 
 User = get_user_model()
 
@@ -17,9 +22,21 @@ class CustomUserViewSet(UserViewSet):
     """Обрабатывает кастомного юзера"""
     queryset = User.objects.all()
     pagination_class = LimitPagePagination
+    cursor_ordering = ('id',)
     serializer_class = CustomUserSerializer
     permission_classes = [IsAuthenticated]
 
+    def get_recipes_limit(self):
+        """Проверенное значение recipes_limit, не больше максимума"""
+        limit = self.request.query_params.get('recipes_limit')
+        if limit is None:
+            return settings.SUBSCRIPTION_RECIPES_LIMIT
+        if not limit.isdigit():
+            raise ValidationError({
+                'recipes_limit': 'Должно быть неотрицательным числом'
+            })
+        return min(int(limit), settings.SUBSCRIPTION_RECIPES_LIMIT)
+
     @action(
         detail=True,
         methods=['post', 'delete'],
@@ -34,15 +51,22 @@ class CustomUserViewSet(UserViewSet):
                 return Response({
                     'errors': 'Подписка на самого себя не разрешена'
                 }, status=status.HTTP_400_BAD_REQUEST)
-            if user.follower.filter(author=author).exists():
+            recipes_limit = self.get_recipes_limit()
+            try:
+                with transaction.atomic():
+                    Follow.objects.create(user=user, author=author)
+            except IntegrityError:
                 return Response({
                     'errors': 'Подписка уже состоялась'
                 }, status=status.HTTP_400_BAD_REQUEST)
+            author.is_subscribed = True
             serializer = FollowSerializer(
-                author, data=request.data, context={'request': request}
+                author,
+                context={
+                    'request': request,
+                    'recipes_limit': recipes_limit,
+                }
             )
-            serializer.is_valid(raise_exception=True)
-            Follow.objects.create(user=user, author=author)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         if request.method == 'DELETE':
@@ -55,11 +79,18 @@ class CustomUserViewSet(UserViewSet):
     def subscriptions(self, request):
         """Подписки пользователя"""
         user = self.request.user
-        queryset = User.objects.filter(following__user=user)
+        limit = self.get_recipes_limit()
+        queryset = User.objects.filter(following__user=user).annotate(
+            is_subscribed=Value(True, output_field=BooleanField())
+        ).prefetch_related(Prefetch(
+            'recipes',
+            queryset=Recipe.objects.order_by('-pub_date', '-id')[:limit],
+            to_attr='recipe_previews'
+        ))
         pages = self.paginate_queryset(queryset)
         serializer = FollowSerializer(
             pages,
             many=True,
-            context={'request': request}
+            context={'request': request, 'recipes_limit': limit}
         )
         return self.get_paginated_response(serializer.data)